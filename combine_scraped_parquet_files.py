@@ -50,7 +50,9 @@ def combine_parquet_files(folder_path, duplicate_columns, output_file_path):
     combined_df['Message ID'] = combined_df['Message ID'].astype(str)
 
     # Add "@" to the beginning of items in 'Group' column if missing before checking duplicates
-    combined_df['Group'] = combined_df['Group'].apply(lambda x: x if x.startswith('@') else '@' + x)
+    # Vectorized prefix check instead of a Python-level lambda per row
+    missing_at = ~combined_df['Group'].str.startswith('@', na=True)
+    combined_df.loc[missing_at, 'Group'] = '@' + combined_df.loc[missing_at, 'Group']
 
     print(f"Number of rows before removing duplicates: {len(combined_df)}")
     print(f"Checking duplicates based on columns {duplicate_columns}...")
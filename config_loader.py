@@ -2,12 +2,13 @@ import os
 import re
 import json
 import logging
-from dotenv import load_dotenv
+import functools
 from typing import List, Optional
 from dataclasses import dataclass, field
 
-# Ensure find_dotenv is imported if not already (it should be based on previous state)
-from dotenv import load_dotenv, find_dotenv
+from dotenv import load_dotenv
+
+from utils import json_loads
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,10 @@ DEFAULT_EXPECTED_HEADERS = [
 ]
 DEFAULT_FIT_KEYWORDS = ['python', 'javascript', 'react', 'node', 'web', 'full-stack', 'backend', 'frontend', 'remote', 'developer', 'engineer', 'software']
 DEFAULT_SALARY_THRESHOLD = 100000
+# MessageStore never evicts a channel's newest keys below this count (the cold-start fetch limit)
+MESSAGE_STORE_KEYS_PER_CHANNEL = 100
+
+_PHONE_RE = re.compile(r'^\+\d{8,15}$')
 
 @dataclass
 class AppConfig:
@@ -39,6 +44,7 @@ class AppConfig:
     session_file: str = 'telegram_monitor.session' # Default session file name
     log_file: str = 'telegram_monitor.log'
     processed_messages_file: str = 'processed_messages.pkl'
+    queue_db_file: str = 'job_queue.db' # SQLite store for jobs waiting to be written to the sheet
     base_path: str = os.getcwd() # Default to current working directory
     expected_headers: List[str] = field(default_factory=lambda: list(DEFAULT_EXPECTED_HEADERS)) # Use list() to avoid modifying default
 
@@ -56,13 +62,18 @@ class AppConfig:
     # Add defaults from utils.py
     salary_threshold: int = DEFAULT_SALARY_THRESHOLD
     fit_keywords: List[str] = field(default_factory=lambda: list(DEFAULT_FIT_KEYWORDS)) # Use list()
+    min_message_length: int = 30 # Shorter texts (replies, captions) are not parsed as vacancies
 
     # Message store settings
     message_store_save_interval: int = 300 # Seconds (5 minutes)
     message_store_max_backups: int = 5
+    message_store_save_batch_size: int = 500 # Save early once this many new IDs are unsaved
+    message_store_compact_threshold: int = 10000 # Rewrite the snapshot once the journal holds this many IDs
+    message_store_max_entries: int = 100000 # Oldest processed IDs are forgotten beyond this
 
     # Delay between processing channels
     channel_process_delay: int = 1 # Seconds
+    channel_concurrency: int = 3 # Channels fetched and processed at the same time
 
 
     def __post_init__(self):
@@ -76,13 +87,13 @@ class AppConfig:
         if not (len(self.api_hash) == 32 and self.api_hash.isalnum()):
             raise ValueError("Invalid API_HASH format (expected 32 alphanumeric chars)")
         # Removed phone number debug print
-        if not re.match(r'^\+\d{8,15}$', self.phone):
+        if not _PHONE_RE.match(self.phone):
             raise ValueError("Phone number must be in international format (+XXX...)")
         if not self.google_sheet_id or len(self.google_sheet_id) < 10:
              raise ValueError("Invalid Google Sheet ID format")
         try:
             # Basic JSON structure check for service account
-            creds = json.loads(self.google_credentials_json)
+            creds = json_loads(self.google_credentials_json)
             if not isinstance(creds, dict) or \
                creds.get('type') != 'service_account' or \
                'private_key' not in creds or \
@@ -119,10 +130,42 @@ class AppConfig:
         if self.circuit_breaker_threshold <= 0: raise ValueError("circuit_breaker_threshold must be positive")
         if self.circuit_breaker_timeout <= 0: raise ValueError("circuit_breaker_timeout must be positive")
         if self.salary_threshold < 0: raise ValueError("salary_threshold cannot be negative")
+        if self.min_message_length < 0: raise ValueError("min_message_length cannot be negative")
         if self.message_store_save_interval <= 0: raise ValueError("message_store_save_interval must be positive")
         if self.message_store_max_backups < 0: raise ValueError("message_store_max_backups cannot be negative")
+        if self.message_store_save_batch_size <= 0: raise ValueError("message_store_save_batch_size must be positive")
+        if self.message_store_compact_threshold <= 0: raise ValueError("message_store_compact_threshold must be positive")
+        if self.message_store_max_entries <= 0: raise ValueError("message_store_max_entries must be positive")
+        # Every channel keeps its newest keys, so a smaller cap could never be honoured
+        min_entries = MESSAGE_STORE_KEYS_PER_CHANNEL * max(len(self.channels), 1)
+        if self.message_store_max_entries < min_entries:
+            logger.warning(f"MESSAGE_STORE_MAX_ENTRIES ({self.message_store_max_entries}) is below {MESSAGE_STORE_KEYS_PER_CHANNEL} keys per channel, setting to {min_entries}")
+            self.message_store_max_entries = min_entries
         if self.channel_process_delay < 0: raise ValueError("channel_process_delay cannot be negative")
+        if self.channel_concurrency <= 0: raise ValueError("channel_concurrency must be positive")
+
 
+# Integer settings that can be overridden from the environment: env var -> AppConfig field
+_INT_ENV_VARS = {
+    'CHECK_INTERVAL_HOURS': 'check_interval_hours',
+    'MAX_QUEUE_SIZE': 'max_queue_size',
+    'MAX_BATCH_SIZE': 'max_batch_size',
+    'QUEUE_PROCESSING_INTERVAL': 'queue_processing_interval',
+    'MAX_RETRIES': 'max_retries',
+    'INITIAL_RETRY_DELAY': 'initial_retry_delay',
+    'MEMORY_LIMIT_MB': 'memory_limit_mb',
+    'CIRCUIT_BREAKER_THRESHOLD': 'circuit_breaker_threshold',
+    'CIRCUIT_BREAKER_TIMEOUT': 'circuit_breaker_timeout',
+    'SALARY_THRESHOLD': 'salary_threshold',
+    'MIN_MESSAGE_LENGTH': 'min_message_length',
+    'MESSAGE_STORE_SAVE_INTERVAL': 'message_store_save_interval',
+    'MESSAGE_STORE_MAX_BACKUPS': 'message_store_max_backups',
+    'MESSAGE_STORE_SAVE_BATCH_SIZE': 'message_store_save_batch_size',
+    'MESSAGE_STORE_COMPACT_THRESHOLD': 'message_store_compact_threshold',
+    'MESSAGE_STORE_MAX_ENTRIES': 'message_store_max_entries',
+    'CHANNEL_PROCESS_DELAY': 'channel_process_delay',
+    'CHANNEL_CONCURRENCY': 'channel_concurrency',
+}
 
 def _get_env_var(name: str, default: Optional[str] = None, required: bool = False) -> Optional[str]:
     """Helper to get environment variables."""
@@ -131,8 +174,13 @@ def _get_env_var(name: str, default: Optional[str] = None, required: bool = Fals
         raise ValueError(f"Required environment variable '{name}' is not set.")
     return value
 
+@functools.lru_cache(maxsize=1)
 def load_config() -> AppConfig:
-    """Loads configuration from environment variables and returns an AppConfig object."""
+    """
+    Loads configuration from environment variables and returns an AppConfig object.
+    The result is cached, so repeated calls (e.g. from retry paths) reuse the
+    already validated config instead of re-parsing the environment.
+    """
     logger.info("Loading configuration...")
     try:
         # Required variables
@@ -153,28 +201,19 @@ def load_config() -> AppConfig:
         channels = [c.strip() for c in channels_raw.split(',') if c.strip()] if channels_raw else []
 
         # Load optional vars, using AppConfig defaults if not set or invalid
-        check_interval_hours = int(_get_env_var('CHECK_INTERVAL_HOURS', str(AppConfig.check_interval_hours)) or AppConfig.check_interval_hours)
         worksheet_name = _get_env_var('WORKSHEET_NAME', AppConfig.worksheet_name)
         session_file = _get_env_var('SESSION_FILE', AppConfig.session_file)
         log_file = _get_env_var('LOG_FILE', AppConfig.log_file)
         processed_messages_file = _get_env_var('PROCESSED_MESSAGES_FILE', AppConfig.processed_messages_file)
+        queue_db_file = _get_env_var('QUEUE_DB_FILE', AppConfig.queue_db_file)
         base_path = _get_env_var('BASE_PATH', AppConfig.base_path) # Uses os.getcwd() default now
 
-        # Load constants from env vars, falling back to AppConfig defaults
-        # Add try-except for integer conversions
+        # Load integer settings from env vars, falling back to AppConfig defaults
+        int_settings = {}
         try:
-            max_queue_size = int(_get_env_var('MAX_QUEUE_SIZE', str(AppConfig.max_queue_size)))
-            max_batch_size = int(_get_env_var('MAX_BATCH_SIZE', str(AppConfig.max_batch_size)))
-            queue_processing_interval = int(_get_env_var('QUEUE_PROCESSING_INTERVAL', str(AppConfig.queue_processing_interval)))
-            max_retries = int(_get_env_var('MAX_RETRIES', str(AppConfig.max_retries)))
-            initial_retry_delay = int(_get_env_var('INITIAL_RETRY_DELAY', str(AppConfig.initial_retry_delay)))
-            memory_limit_mb = int(_get_env_var('MEMORY_LIMIT_MB', str(AppConfig.memory_limit_mb)))
-            circuit_breaker_threshold = int(_get_env_var('CIRCUIT_BREAKER_THRESHOLD', str(AppConfig.circuit_breaker_threshold)))
-            circuit_breaker_timeout = int(_get_env_var('CIRCUIT_BREAKER_TIMEOUT', str(AppConfig.circuit_breaker_timeout)))
-            salary_threshold = int(_get_env_var('SALARY_THRESHOLD', str(AppConfig.salary_threshold)))
-            message_store_save_interval = int(_get_env_var('MESSAGE_STORE_SAVE_INTERVAL', str(AppConfig.message_store_save_interval)))
-            message_store_max_backups = int(_get_env_var('MESSAGE_STORE_MAX_BACKUPS', str(AppConfig.message_store_max_backups)))
-            channel_process_delay = int(_get_env_var('CHANNEL_PROCESS_DELAY', str(AppConfig.channel_process_delay))) # Load channel delay
+            for env_name, field_name in _INT_ENV_VARS.items():
+                default = getattr(AppConfig, field_name)
+                int_settings[field_name] = int(_get_env_var(env_name, str(default)) or default)
         except ValueError as e:
             raise ValueError(f"Invalid integer value in environment variable for constants: {e}")
 
@@ -199,28 +238,16 @@ def load_config() -> AppConfig:
             google_sheet_id=google_sheet_id,
             google_credentials_json=google_credentials_json,
             channels=channels,
-            check_interval_hours=check_interval_hours,
             worksheet_name=worksheet_name,
             session_file=session_file,
             log_file=log_file,
             processed_messages_file=processed_messages_file,
+            queue_db_file=queue_db_file,
             base_path=base_path,
-            # Pass loaded constants
-            max_queue_size=max_queue_size,
-            max_batch_size=max_batch_size,
-            queue_processing_interval=queue_processing_interval,
-            max_retries=max_retries,
-            initial_retry_delay=initial_retry_delay,
-            memory_limit_mb=memory_limit_mb,
-            circuit_breaker_threshold=circuit_breaker_threshold,
-            circuit_breaker_timeout=circuit_breaker_timeout,
             message_store_key=message_store_key,
-            salary_threshold=salary_threshold,
             fit_keywords=fit_keywords,
             expected_headers=expected_headers,
-            message_store_save_interval=message_store_save_interval,
-            message_store_max_backups=message_store_max_backups,
-            channel_process_delay=channel_process_delay # Add channel delay
+            **int_settings
         )
         logger.info("Configuration loaded successfully.")
         # Log loaded config excluding sensitive details
@@ -248,6 +275,7 @@ def log_loaded_config(config: AppConfig):
     logger.info(f"  SESSION_FILE: {config.session_file}")
     logger.info(f"  LOG_FILE: {config.log_file}")
     logger.info(f"  PROCESSED_MESSAGES_FILE: {config.processed_messages_file}")
+    logger.info(f"  QUEUE_DB_FILE: {config.queue_db_file}")
     logger.info(f"  BASE_PATH: {config.base_path}")
     logger.info(f"  MAX_QUEUE_SIZE: {config.max_queue_size}")
     logger.info(f"  MAX_BATCH_SIZE: {config.max_batch_size}")
@@ -260,10 +288,15 @@ def log_loaded_config(config: AppConfig):
     logger.info(f"  MESSAGE_STORE_KEY: {'Set' if config.message_store_key else 'Not Set (Encryption Disabled)'}")
     logger.info(f"  SALARY_THRESHOLD: {config.salary_threshold}")
     logger.info(f"  FIT_KEYWORDS: {config.fit_keywords}")
+    logger.info(f"  MIN_MESSAGE_LENGTH: {config.min_message_length}")
     logger.info(f"  EXPECTED_HEADERS: {config.expected_headers}")
     logger.info(f"  MSG_STORE_SAVE_INTERVAL: {config.message_store_save_interval}s")
     logger.info(f"  MSG_STORE_MAX_BACKUPS: {config.message_store_max_backups}")
+    logger.info(f"  MSG_STORE_SAVE_BATCH_SIZE: {config.message_store_save_batch_size}")
+    logger.info(f"  MSG_STORE_COMPACT_THRESHOLD: {config.message_store_compact_threshold}")
+    logger.info(f"  MSG_STORE_MAX_ENTRIES: {config.message_store_max_entries}")
     logger.info(f"  CHANNEL_PROCESS_DELAY: {config.channel_process_delay}s")
+    logger.info(f"  CHANNEL_CONCURRENCY: {config.channel_concurrency}")
     logger.info("--------------------------")
 
 # Example usage:
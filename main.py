@@ -6,6 +6,7 @@ import os
 import gc
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
+from typing import List, Optional
 
 # Import refactored components
 from config_loader import load_config, AppConfig
@@ -45,100 +46,147 @@ def setup_logging(config: AppConfig):
     logger.info("Logging setup complete.")
 
 
+def _parse_messages(messages, channel_title: str, config: AppConfig) -> List[Optional[dict]]:
+    """Parse a batch of messages into job data (None for messages without text). Runs in a worker thread."""
+    parsed_jobs = []
+    for message in messages:
+        job_data = None
+        # Short texts (replies, media captions) cannot hold a vacancy; skip the parse entirely
+        if message.text and len(message.text) >= config.min_message_length:
+            # Parse the message text using the utility function
+            # Pass message timestamp and configurable parameters
+            job_data = parse_job_vacancy(
+                text=message.text,
+                channel_title=channel_title,
+                message_timestamp=message.date, # Use message timestamp
+                salary_threshold=config.salary_threshold,
+                fit_keywords=config.fit_keywords
+            )
+        parsed_jobs.append(job_data)
+    return parsed_jobs
+
+
+async def _process_new_messages(new_messages, channel_id: int, channel_title: str, message_store, queue_manager, config: AppConfig) -> int:
+    """Parse a chunk of unseen messages, queue the jobs found and mark them processed. Returns the job count."""
+    new_jobs_found = 0
+    # Parsing is regex-heavy CPU work; run the whole chunk in a worker thread
+    # so the event loop keeps serving Telegram and the queue meanwhile.
+    parsed_jobs = await asyncio.to_thread(_parse_messages, new_messages, channel_title, config)
+
+    jobs = []
+    for message, job_data in zip(new_messages, parsed_jobs):
+        if job_data and job_data.get('position'): # Ensure a position was found
+            logger.info(f"Found potential job: '{job_data['position']}' in {channel_title} (Msg ID: {message.id})")
+            jobs.append(job_data)
+            new_jobs_found += 1
+        # else:
+            # logger.debug(f"Message ID {message.id} from {channel_title} did not parse as a valid job or lacked position.")
+
+    # Queue the whole chunk at once: one QueueStore transaction instead of one per job
+    await queue_manager.add_jobs(jobs)
+
+    # Add message IDs to store regardless of whether they were jobs, to avoid re-processing.
+    # Done after queueing, so a store save never covers messages whose jobs are not persisted.
+    for message in new_messages:
+        message_store.add((channel_id, message.id))
+    return new_jobs_found
+
+
 async def process_channel_messages(client_manager: TelegramClientManager, client, channel_entity, message_store, queue_manager, config: AppConfig):
     """Fetch and process messages from a single channel."""
-    channel_title = getattr(channel_entity, 'title', str(channel_entity.id))
+    channel_id = channel_entity.id
+    channel_title = getattr(channel_entity, 'title', str(channel_id))
     logger.info(f"Processing messages for channel: {channel_title}")
     processed_count = 0
     new_jobs_found = 0
 
     try:
-        # Fetch messages using the client manager's retry mechanism
-        # TODO: Consider using iter_messages with offset_id for robustness against missed messages
-        # Current limit=100 might miss messages in high-volume channels between checks.
+        # Fetch size for channels without history; also the size of each parse chunk.
         # Limit could be made configurable via AppConfig.
-        fetch_limit = 100 # Example limit
-        logger.debug(f"Fetching last {fetch_limit} messages from {channel_title}...")
-        messages = await client_manager.execute_with_retry(
-            client.get_messages,
-            channel_entity,
-            limit=fetch_limit
-        )
-
-        if not messages:
-            logger.info(f"No messages found or retrieved for channel: {channel_title}")
-            return
-
-        logger.debug(f"Retrieved {len(messages)} messages from {channel_title}")
-
-        for message in messages:
+        fetch_limit = 100
+        # Only ask Telegram for messages newer than the last one already seen. Once a
+        # channel has a mark, everything newer is fetched (Telethon pages internally),
+        # so high-volume channels no longer lose messages between checks.
+        min_id = message_store.last_seen_id(channel_id)
+        limit = None if min_id else fetch_limit
+        # With a mark, stream oldest first so the mark can advance after every chunk:
+        # if the stream fails partway, the next run resumes right after the last
+        # handled chunk. Without one, take the newest fetch_limit messages and only
+        # set the mark once all of them are handled.
+        reverse = bool(min_id)
+        logger.debug(f"Streaming messages from {channel_title} (min_id={min_id}, limit={limit}, reverse={reverse})...")
+
+        # iter_messages is not wrapped by execute_with_retry, so make sure the
+        # connection is up (reconnecting if needed) before streaming
+        client = await client_manager.get_client()
+        retrieved_count = 0
+        newest_id = 0
+        new_messages = []
+        # Stream messages instead of materializing the whole result; chunks are
+        # parsed and queued while later pages are still being fetched
+        async for message in client.iter_messages(channel_entity, limit=limit, min_id=min_id, reverse=reverse):
             if not message or not message.id:
                  logger.debug("Skipping empty or invalid message object.")
                  continue
+            retrieved_count += 1
+            newest_id = max(newest_id, message.id)
 
-            # Check if message already processed using MessageStore
-            if message.id in message_store:
+            # Check if message already processed using MessageStore (IDs are per chat)
+            if (channel_id, message.id) in message_store:
                 # logger.debug(f"Skipping already processed message ID {message.id} from {channel_title}")
                 continue
+            new_messages.append(message)
+
+            if len(new_messages) >= fetch_limit:
+                new_jobs_found += await _process_new_messages(new_messages, channel_id, channel_title, message_store, queue_manager, config)
+                processed_count += len(new_messages)
+                new_messages = []
+                if reverse:
+                    # Everything up to newest_id is handled (processed or already stored)
+                    message_store.update_last_seen_id(channel_id, newest_id)
+
+        if new_messages:
+            new_jobs_found += await _process_new_messages(new_messages, channel_id, channel_title, message_store, queue_manager, config)
+            processed_count += len(new_messages)
+
+        if not retrieved_count:
+            logger.info(f"No messages found or retrieved for channel: {channel_title}")
+            return
+
+        logger.debug(f"Retrieved {retrieved_count} messages from {channel_title}")
 
-            processed_count += 1
-            if message.text:
-                # Parse the message text using the utility function
-                # Pass message timestamp and configurable parameters
-                job_data = parse_job_vacancy(
-                    text=message.text,
-                    channel_title=channel_title,
-                    message_timestamp=message.date, # Use message timestamp
-                    salary_threshold=config.salary_threshold,
-                    fit_keywords=config.fit_keywords
-                )
-
-                if job_data and job_data.get('position'): # Ensure a position was found
-                    logger.info(f"Found potential job: '{job_data['position']}' in {channel_title} (Msg ID: {message.id})")
-                    # Add the job data dictionary to the queue manager
-                    await queue_manager.add_to_queue(job_data)
-                    new_jobs_found += 1
-                # else:
-                    # logger.debug(f"Message ID {message.id} from {channel_title} did not parse as a valid job or lacked position.")
-
-            # Add message ID to store regardless of whether it was a job, to avoid re-processing
-            message_store.add(message.id)
+        # Everything fetched is handled now, so the next run can start after the newest ID
+        message_store.update_last_seen_id(channel_id, newest_id)
 
         logger.info(f"Finished processing {processed_count} new messages for {channel_title}. Found {new_jobs_found} potential jobs.")
 
-        # Removed message_store.save() from here - will save at the end of monitor_channels
+        # Saves in the background once enough new IDs piled up or the save interval
+        # passed; the forced save at the end of monitor_channels covers the rest
+        message_store.request_save()
 
     except Exception as e:
         logger.error(f"Error processing messages for channel {channel_title}: {e}", exc_info=True)
         # Continue to the next channel
 
 
-async def monitor_channels(client_manager: TelegramClientManager, message_store, queue_manager: QueueManager, config: AppConfig):
-    """Monitor configured Telegram channels for new messages."""
-    logger.info(f"Starting channel monitoring run. Monitoring {len(config.channels)} channels.")
-    client = await client_manager.get_client() # Ensure client is ready
-
-    # Process channels sequentially or concurrently? Sequential is simpler for rate limits.
-    for channel_identifier in config.channels:
+async def _monitor_channel(client_manager: TelegramClientManager, client, channel_identifier, message_store, queue_manager: QueueManager, config: AppConfig, semaphore: asyncio.Semaphore):
+    """Resolve and process a single channel, holding a concurrency slot for the duration."""
+    async with semaphore:
         try:
             logger.debug(f"Getting entity for channel identifier: {channel_identifier}")
-            # Get channel entity using client manager's retry mechanism
-            channel_entity = await client_manager.execute_with_retry(
-                client.get_entity,
-                channel_identifier
-            )
+            # Get channel entity (cached after the first run) using client manager's retry mechanism
+            channel_entity = await client_manager.get_entity(channel_identifier)
 
             if not channel_entity:
                  logger.warning(f"Could not find entity for channel: {channel_identifier}. Skipping.")
-                 continue
+                 return
 
             # Process messages for this channel
             # Pass client_manager instance
             await process_channel_messages(client_manager, client, channel_entity, message_store, queue_manager, config)
 
-            # Use configurable delay between processing channels
-            # Check attribute existence before accessing
-            if hasattr(config, 'channel_process_delay') and config.channel_process_delay > 0:
+            # Use configurable delay between processing channels (per concurrency slot)
+            if config.channel_process_delay > 0:
                  logger.debug(f"Waiting {config.channel_process_delay}s before next channel...")
                  await asyncio.sleep(config.channel_process_delay)
 
@@ -148,9 +196,21 @@ async def monitor_channels(client_manager: TelegramClientManager, message_store,
         except Exception as e:
             # Catch errors during entity fetching or message processing for a single channel
             logger.error(f"Failed to process channel '{channel_identifier}': {e}", exc_info=True)
-            # Continue with the next channel
+            # Continue with the other channels
+
+
+async def monitor_channels(client_manager: TelegramClientManager, message_store, queue_manager: QueueManager, config: AppConfig):
+    """Monitor configured Telegram channels for new messages."""
+    logger.info(f"Starting channel monitoring run. Monitoring {len(config.channels)} channels.")
+    client = await client_manager.get_client() # Ensure client is ready
 
-        # Removed explicit gc.collect() call
+    # Process channels concurrently, bounded by the semaphore so Telegram RPC
+    # latency overlaps without hammering rate limits. CHANNEL_CONCURRENCY=1 is sequential.
+    semaphore = asyncio.Semaphore(config.channel_concurrency)
+    await asyncio.gather(*(
+        _monitor_channel(client_manager, client, channel_identifier, message_store, queue_manager, config, semaphore)
+        for channel_identifier in config.channels
+    ))
 
     logger.info("Finished channel monitoring run.")
     # Save message store state once after processing all channels
@@ -189,18 +249,6 @@ async def run_app(config: AppConfig):
         # Specific handling for Telegram connection errors during startup/runtime
         logger.critical(f"Telegram connection error: {e}. Application cannot continue.", exc_info=True)
         # Perform minimal cleanup if possible (logging already handled by finally)
-    except asyncio.CancelledError:
-        async with client_manager, sheet_manager, queue_manager, MessageStore(config) as message_store:
-            logger.info("Application components initialized successfully.")
-
-            while True: # Main monitoring loop
-                logger.info("Starting new monitoring cycle...")
-                await monitor_channels(client_manager, message_store, queue_manager, config)
-
-                logger.info(f"Monitoring cycle complete. Waiting {config.check_interval_hours} hour(s) for next cycle.")
-                # Wait for the configured interval
-                await asyncio.sleep(config.check_interval_hours * 3600)
-
     except asyncio.CancelledError:
         logger.info("Main application loop cancelled.")
     except Exception as e:
@@ -222,6 +270,10 @@ def main():
 
         logger.info("=== Telegram Job Monitor Starting ===")
 
+        # Most per-message allocations (dicts, lists, strings) are acyclic and freed by
+        # refcounting; a higher gen-0 threshold avoids frequent collector pauses on the loop
+        gc.set_threshold(50_000, 100, 100)
+
         # Run the main async application
         asyncio.run(run_app(config))
 
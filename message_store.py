@@ -4,11 +4,12 @@ import os
 import pickle
 import time
 import base64
+from collections import OrderedDict, deque
 from datetime import datetime
 from pathlib import Path
 import shutil # Added
 import tempfile # Added
-from typing import Set, Optional # Optional added
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union # Optional added
 
 import aiofiles
 # Ensure cryptography is installed: pip install cryptography
@@ -21,10 +22,16 @@ except ImportError:
     CRYPTOGRAPHY_AVAILABLE = False
     logging.getLogger(__name__).warning("Cryptography library not found. MessageStore encryption disabled. Install with 'pip install cryptography'")
 
-from config_loader import AppConfig
+from config_loader import AppConfig, MESSAGE_STORE_KEYS_PER_CHANNEL
 
 logger = logging.getLogger(__name__)
 
+# fdatasync is not available on every platform (e.g. macOS), fall back to fsync
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+# Message IDs are only unique within a chat, so processed messages are keyed by (chat_id, message_id)
+MessageKey = Tuple[int, int]
+
 class MessageStore:
     """Handles persistence and state management for processed message IDs with optional encryption."""
 
@@ -33,12 +40,33 @@ class MessageStore:
         self.base_path = Path(config.base_path).resolve()
         self.messages_file = self.base_path / config.processed_messages_file
         self.backup_dir = self.base_path / 'message_backups'
+        # New IDs are appended here between full snapshots, one record per save
+        self.journal_file = self.messages_file.with_name(self.messages_file.name + '.journal')
         self._lock = asyncio.Lock()
-        self._messages: Set[int] = set()
+        # Insertion-ordered so the oldest IDs can be evicted once max_entries is reached
+        # Bare ints are message IDs from stores written before keys included the chat ID
+        self._messages: "OrderedDict[Union[MessageKey, int], None]" = OrderedDict()
+        self._has_legacy_ids = False
+        self._max_entries = config.message_store_max_entries
+        # Stored keys per chat ID in insertion order, for eviction (legacy bare IDs under None)
+        self._channel_keys: Dict[Optional[int], deque] = {}
+        # Set when every stored key is protected by the per-channel floor; eviction is
+        # skipped until a channel grows past the floor again
+        self._eviction_blocked = False
+        self._over_cap_logged = False
+        # Highest message ID handled per channel, used as min_id for the next fetch.
+        # Persisted explicitly: stored keys are evictable and may have gaps after a failed run.
+        self._last_seen_ids: Dict[int, int] = {}
+        self._dirty_marks: Set[int] = set() # Channels whose last seen ID changed since the last save
+        self._pending: List[MessageKey] = [] # Keys added since the last save, not yet on disk
+        self._journal_size = 0 # IDs currently held in the journal
+        self._save_task: Optional[asyncio.Task] = None # Background save started by request_save()
         self._last_save_time = 0
         # Use values from config
         self._save_interval = config.message_store_save_interval
         self._max_backups = config.message_store_max_backups
+        self._save_batch_size = config.message_store_save_batch_size
+        self._compact_threshold = config.message_store_compact_threshold
         self._encryption_key = self._get_encryption_key() # Returns None if key missing/invalid or crypto lib missing
         self._fernet: Optional[Fernet] = None
 
@@ -129,48 +157,126 @@ class MessageStore:
     async def load(self):
         """Load processed message IDs from the file."""
         async with self._lock:
-            logger.debug(f"Attempting to load messages from {self.messages_file}")
+            logger.debug("Attempting to load messages from %s", self.messages_file)
+            self._pending = []
+            self._last_seen_ids = {}
+            self._dirty_marks = set()
             if not self.messages_file.exists():
                 logger.info("No existing messages file found. Starting with an empty set.")
-                self._messages = set()
-                return self._messages
-
-            try:
-                async with aiofiles.open(self.messages_file, 'rb') as f:
-                    raw_data = await f.read()
-
-                decrypted_data = self._decrypt_data(raw_data) # Raises InvalidToken on failure if encrypted
+                self._messages = OrderedDict()
+            else:
+                try:
+                    async with aiofiles.open(self.messages_file, 'rb') as f:
+                        raw_data = await f.read()
+
+                    decrypted_data = self._decrypt_data(raw_data) # Raises InvalidToken on failure if encrypted
+
+                    # WARNING: Unpickling data can be insecure if the source file is compromised.
+                    # Consider using a safer format like JSON if feasible.
+                    loaded_messages = pickle.loads(decrypted_data)
+
+                    # Snapshots hold the ordered keys (oldest first) and the per-channel last seen
+                    # IDs; older files are a bare ordered list or an unordered set of keys
+                    if isinstance(loaded_messages, dict):
+                        self._messages = OrderedDict.fromkeys(loaded_messages.get('keys', ()))
+                        self._last_seen_ids = dict(loaded_messages.get('last_seen_ids', {}))
+                        logger.info(f"Successfully loaded {len(self._messages)} processed message IDs.")
+                    elif isinstance(loaded_messages, (list, set)):
+                        self._messages = OrderedDict.fromkeys(loaded_messages)
+                        logger.info(f"Successfully loaded {len(self._messages)} processed message IDs.")
+                    else:
+                        logger.warning(f"Loaded data is not a dict, list or set (type: {type(loaded_messages)}). Discarding and starting fresh.")
+                        self._messages = OrderedDict()
+                        # Consider backing up the invalid file
+                        self._backup_invalid_file("invalid_type")
+
+                except FileNotFoundError:
+                     logger.info("Messages file not found on load (race condition?). Starting fresh.")
+                     self._messages = OrderedDict()
+                except (pickle.UnpicklingError, EOFError, TypeError, ValueError) as e:
+                    logger.error(f"Failed to unpickle message data from {self.messages_file} (corrupted?): {e}")
+                    self._messages = OrderedDict()
+                    self._backup_invalid_file("unpickle_error")
+                except InvalidToken: # Specific decryption error
+                     logger.error(f"Failed to decrypt {self.messages_file}. Key might have changed or file is corrupted.")
+                     self._messages = OrderedDict()
+                     self._backup_invalid_file("decryption_error")
+                except Exception as e:
+                    logger.error(f"Unexpected error loading messages from {self.messages_file}: {e}", exc_info=True)
+                    self._messages = OrderedDict() # Start fresh on unknown errors
+                    self._backup_invalid_file("load_error")
+
+            # A journal can exist without a snapshot (crash before the first compaction),
+            # so both paths go through the same replay and post-load steps
+            await self._replay_journal()
+            self._index_loaded_keys()
+            self._evict_oldest()
+            self._dirty_marks = set() # Marks replayed from the journal are already on disk
+            return self._messages
 
-                # WARNING: Unpickling data can be insecure if the source file is compromised.
-                # Consider using a safer format like JSON if feasible.
-                loaded_messages = pickle.loads(decrypted_data)
+    def _index_loaded_keys(self):
+        """Rebuild the per-channel key index and note whether legacy bare IDs are present."""
+        self._channel_keys = {}
+        self._eviction_blocked = False
+        for key in self._messages:
+            channel_id = key[0] if isinstance(key, tuple) else None
+            self._channel_keys.setdefault(channel_id, deque()).append(key)
+        self._has_legacy_ids = bool(self._channel_keys.get(None))
+
+    async def _replay_journal(self):
+        """Merge keys appended to the journal since the last full snapshot."""
+        self._journal_size = 0
+        if not self.journal_file.exists():
+            return
+        try:
+            async with aiofiles.open(self.journal_file, 'rb') as f:
+                raw_journal = await f.read()
+        except Exception as e:
+            logger.error(f"Error reading message journal {self.journal_file}: {e}")
+            return
 
-                if isinstance(loaded_messages, set):
-                    self._messages = loaded_messages
-                    logger.info(f"Successfully loaded {len(self._messages)} processed message IDs.")
-                else:
-                    logger.warning(f"Loaded data is not a set (type: {type(loaded_messages)}). Discarding and starting fresh.")
-                    self._messages = set()
-                    # Consider backing up the invalid file
-                    self._backup_invalid_file("invalid_type")
-
-            except FileNotFoundError:
-                 logger.info("Messages file not found on load (race condition?). Starting fresh.")
-                 self._messages = set()
-            except (pickle.UnpicklingError, EOFError, TypeError, ValueError) as e:
-                logger.error(f"Failed to unpickle message data from {self.messages_file} (corrupted?): {e}")
-                self._messages = set()
-                self._backup_invalid_file("unpickle_error")
-            except InvalidToken: # Specific decryption error
-                 logger.error(f"Failed to decrypt {self.messages_file}. Key might have changed or file is corrupted.")
-                 self._messages = set()
-                 self._backup_invalid_file("decryption_error")
+        replayed = 0
+        for line in raw_journal.splitlines():
+            if not line:
+                continue
+            try:
+                ids, marks = self._decode_record(self._decrypt_data(line))
             except Exception as e:
-                logger.error(f"Unexpected error loading messages from {self.messages_file}: {e}", exc_info=True)
-                self._messages = set() # Start fresh on unknown errors
-                self._backup_invalid_file("load_error")
-
-            return self._messages
+                # A torn final record from a crash mid-append is expected, skip it
+                logger.warning(f"Skipping unreadable message journal record: {e!r}")
+                continue
+            self._messages.update(dict.fromkeys(ids))
+            for channel_id, message_id in marks:
+                self.update_last_seen_id(channel_id, message_id)
+            replayed += len(ids)
+
+        self._journal_size = replayed
+        if replayed:
+            logger.info(f"Replayed {replayed} message IDs from journal {self.journal_file.name}.")
+
+    @staticmethod
+    def _encode_record(keys: Iterable[MessageKey], marks: Iterable[Tuple[int, int]] = ()) -> bytes:
+        """
+        Serialize a batch of (chat_id, message_id) keys and (chat_id, last_seen_id)
+        marks as a single journal record. Marks are prefixed with '='.
+        """
+        tokens = [f'{chat_id}:{message_id}' for chat_id, message_id in keys]
+        tokens.extend(f'={chat_id}:{message_id}' for chat_id, message_id in marks)
+        return ' '.join(tokens).encode('ascii')
+
+    @staticmethod
+    def _decode_record(record: bytes) -> Tuple[List[Union[MessageKey, int]], List[Tuple[int, int]]]:
+        """Parse a journal record produced by _encode_record (bare IDs from older journals stay ints)."""
+        keys = []
+        marks = []
+        for token in record.split():
+            if token.startswith(b'='):
+                chat_id, _, message_id = token[1:].partition(b':')
+                marks.append((int(chat_id), int(message_id)))
+                continue
+            chat_id, sep, message_id = token.partition(b':')
+            keys.append((int(chat_id), int(message_id)) if sep else int(chat_id))
+        return keys, marks
 
     def _backup_invalid_file(self, reason: str):
         """Create a backup of the problematic messages file."""
@@ -184,58 +290,118 @@ class MessageStore:
                 logger.error(f"Could not back up problematic messages file {self.messages_file}: {e}")
 
 
-    async def save(self, force: bool = False):
-        """Save the current set of processed message IDs to the file."""
+    async def save(self, force: bool = False, compact: bool = False):
+        """
+        Persist processed message IDs. Unless forced, this only writes once the
+        save interval has passed or enough new IDs have accumulated, so it is
+        cheap to call often. New IDs are appended to the journal; the
+        full snapshot is only rewritten when compacting (explicitly, when no
+        snapshot exists yet, or once the journal grows past the threshold).
+        """
         current_time = time.monotonic()
-        if not force and current_time - self._last_save_time < self._save_interval:
-            # logger.debug("Skipping periodic save, interval not reached.")
+        if (not force
+                and len(self._pending) < self._save_batch_size
+                and current_time - self._last_save_time < self._save_interval):
+            # logger.debug("Skipping periodic save, interval and batch size not reached.")
             return
 
         async with self._lock:
-            logger.debug(f"Attempting to save {len(self._messages)} message IDs...")
-            temp_file_path = None
-            try:
-                # Serialize data using pickle
-                raw_data = pickle.dumps(self._messages)
-                # Encrypt data if enabled (raises ValueError on failure)
-                data_to_write = self._encrypt_data(raw_data)
+            compact = (compact
+                       or not self.messages_file.exists()
+                       or self._journal_size + len(self._pending) >= self._compact_threshold)
+            if not compact and not self._pending and not self._dirty_marks:
+                self._last_save_time = current_time
+                return
 
-                # Write to a temporary file first for atomicity
-                # Use aiofiles within an executor for sync file operations like delete/rename
+            # Take ownership of pending IDs and changed marks; add() may run while we await the write
+            pending, self._pending = self._pending, []
+            dirty_marks, self._dirty_marks = self._dirty_marks, set()
+            try:
                 loop = asyncio.get_running_loop()
-                temp_dir = self.messages_file.parent
-                # Create a temporary file in the same directory
-                fd, temp_file_path_str = await loop.run_in_executor(
-                    None, tempfile.mkstemp, ".tmp", self.messages_file.name + '_', temp_dir
-                )
-                temp_file_path = Path(temp_file_path_str)
-
-                # Write data asynchronously
-                async with aiofiles.open(fd, 'wb') as f: # Open using file descriptor
-                    await f.write(data_to_write)
-
-                # Atomically replace the original file with the temporary file
-                await loop.run_in_executor(None, os.replace, temp_file_path, self.messages_file)
-                temp_file_path = None # Indicate successful move
+                if compact:
+                    await self._save_snapshot(loop)
+                else:
+                    # Encrypt data if enabled (raises ValueError on failure)
+                    marks = [(channel_id, self._last_seen_ids[channel_id]) for channel_id in dirty_marks]
+                    record = self._encrypt_data(self._encode_record(pending, marks))
+                    await loop.run_in_executor(None, self._append_journal, record + b'\n')
+                    self._journal_size += len(pending)
+                    logger.debug("Appended %d message IDs to %s", len(pending), self.journal_file)
 
                 self._last_save_time = current_time
-                logger.info(f"Saved {len(self._messages)} message IDs to {self.messages_file}")
-
-                # Create backup (after successful primary save)
-                # Corrected: Pass the actual data that was written
-                await self._create_backup(data_to_write)
 
             except Exception as e:
+                # Keep the IDs so the next save retries them
+                self._pending = pending + self._pending
+                self._dirty_marks |= dirty_marks
                 logger.error(f"Error saving messages to {self.messages_file}: {e}", exc_info=True)
+
+    def request_save(self):
+        """
+        Start a non-forced save in the background so callers are not blocked by
+        disk I/O. Coalesces with a background save that is still running.
+        """
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self.save())
+
+    async def _save_snapshot(self, loop: asyncio.AbstractEventLoop):
+        """Rewrite the full snapshot, then drop the journal it now supersedes."""
+        logger.debug("Attempting to save %d message IDs...", len(self._messages))
+        # Serialize data using pickle
+        snapshot = {'keys': list(self._messages), 'last_seen_ids': self._last_seen_ids}
+        raw_data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+        # Encrypt data if enabled (raises ValueError on failure)
+        data_to_write = self._encrypt_data(raw_data)
+
+        # Write to a temporary file and atomically replace the original
+        await loop.run_in_executor(None, self._write_atomic, data_to_write)
+        # Journal entries are all in the snapshot now; a crash before this line only replays duplicates
+        self.journal_file.unlink(missing_ok=True)
+        self._journal_size = 0
+        logger.info(f"Saved {len(self._messages)} message IDs to {self.messages_file}")
+
+        # Create backup (after successful primary save)
+        # Corrected: Pass the actual data that was written
+        await self._create_backup(data_to_write)
+
+    def _append_journal(self, record: bytes):
+        """Append a record to the journal and sync it. Runs in an executor."""
+        fd = os.open(self.journal_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            view = memoryview(record)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            _fdatasync(fd)
+        finally:
+            os.close(fd)
+
+    def _write_atomic(self, data: bytes):
+        """
+        Write data to a temporary file with raw os.write calls, sync it and
+        atomically replace the messages file. Runs in an executor.
+        """
+        fd, temp_file_path_str = tempfile.mkstemp(".tmp", self.messages_file.name + '_', self.messages_file.parent)
+        temp_file_path = Path(temp_file_path_str)
+        try:
+            try:
+                # Payload is already fully serialized, so write it in as few syscalls as possible
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+                _fdatasync(fd) # Flush file data only, metadata is handled by os.replace
             finally:
-                # Clean up temporary file if it still exists (i.e., rename failed)
-                if temp_file_path and temp_file_path.exists():
-                    loop = asyncio.get_running_loop()
-                    try:
-                        await loop.run_in_executor(None, os.remove, temp_file_path)
-                        logger.warning(f"Removed temporary save file due to error: {temp_file_path}")
-                    except OSError as rm_err:
-                        logger.error(f"Error removing temporary save file {temp_file_path}: {rm_err}")
+                os.close(fd)
+            os.replace(temp_file_path, self.messages_file)
+        except Exception:
+            # Clean up temporary file if the write or rename failed
+            try:
+                os.remove(temp_file_path)
+                logger.warning(f"Removed temporary save file due to error: {temp_file_path}")
+            except OSError as rm_err:
+                logger.error(f"Error removing temporary save file {temp_file_path}: {rm_err}")
+            raise
 
 
     async def _create_backup(self, data_to_backup: bytes):
@@ -278,21 +444,76 @@ class MessageStore:
         except Exception as e:
             logger.error(f"Error during backup cleanup: {e}")
 
-    def add(self, message_id: int):
-        """Add a message ID to the processed set."""
+    def add(self, key: MessageKey):
+        """Add a (chat_id, message_id) key to the processed set."""
         # No lock needed for adding to a set if reads don't happen concurrently with writes
         # But save() is async and locked, so adding should be fine.
-        self._messages.add(message_id)
-
-    def __contains__(self, message_id: int) -> bool:
-        """Check if a message ID has been processed."""
-        # Reading from set is thread-safe/async-safe
-        return message_id in self._messages
+        if key not in self._messages:
+            self._messages[key] = None
+            channel_keys = self._channel_keys.setdefault(key[0], deque())
+            channel_keys.append(key)
+            if len(channel_keys) > MESSAGE_STORE_KEYS_PER_CHANNEL:
+                self._eviction_blocked = False # This channel has an evictable key again
+            self._pending.append(key)
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        """
+        Drop the oldest keys beyond max_entries, except each channel's newest
+        MESSAGE_STORE_KEYS_PER_CHANNEL. When the globally oldest key is protected,
+        the oldest key of the channel holding the most keys goes instead, so every
+        eviction costs O(channels) rather than a scan of the store.
+        """
+        while not self._eviction_blocked and len(self._messages) > self._max_entries:
+            key = next(iter(self._messages))
+            channel_keys = self._channel_keys[key[0] if isinstance(key, tuple) else None]
+            if isinstance(key, tuple) and len(channel_keys) <= MESSAGE_STORE_KEYS_PER_CHANNEL:
+                channel_keys = self._evictable_channel_keys()
+                if channel_keys is None:
+                    # Every key is protected; stop until a channel grows past the floor
+                    self._eviction_blocked = True
+                    if not self._over_cap_logged:
+                        self._over_cap_logged = True
+                        logger.warning(f"Message store holds {len(self._messages)} IDs, above MESSAGE_STORE_MAX_ENTRIES ({self._max_entries}), "
+                                       f"because each channel keeps its newest {MESSAGE_STORE_KEYS_PER_CHANNEL}.")
+                    return
+            # A channel's keys are evicted oldest first, so the left end is always the oldest stored
+            del self._messages[channel_keys.popleft()]
+
+    def _evictable_channel_keys(self) -> Optional[deque]:
+        """Key deque to evict from when the oldest key is protected: legacy IDs first, then the largest channel above the floor."""
+        legacy_keys = self._channel_keys.get(None)
+        if legacy_keys:
+            return legacy_keys
+        largest = max((keys for channel_id, keys in self._channel_keys.items() if channel_id is not None), key=len, default=None)
+        if largest is not None and len(largest) > MESSAGE_STORE_KEYS_PER_CHANNEL:
+            return largest
+        return None
+
+    def last_seen_id(self, channel_id: int) -> int:
+        """Highest message ID handled in a channel (persisted with the store), or 0 if none."""
+        return self._last_seen_ids.get(channel_id, 0)
+
+    def update_last_seen_id(self, channel_id: int, message_id: int):
+        """Record message_id as seen in the channel if it is newer than the current one."""
+        if message_id > self._last_seen_ids.get(channel_id, 0):
+            self._last_seen_ids[channel_id] = message_id
+            self._dirty_marks.add(channel_id)
+
+    def __contains__(self, key: MessageKey) -> bool:
+        """Check if a (chat_id, message_id) key has been processed."""
+        # Reading from the dict is thread-safe/async-safe
+        if key in self._messages:
+            return True
+        # Stores from before chat-scoped keys only know the bare message ID
+        return self._has_legacy_ids and key[1] in self._messages
 
     async def cleanup(self):
         """Perform final save on cleanup."""
         logger.info("MessageStore cleanup: performing final save...")
-        await self.save(force=True)
+        if self._save_task is not None:
+            await self._save_task # Let a background save finish before compacting
+        await self.save(force=True, compact=True)
         # Optional: Add cleanup for very old messages from the set itself
         # await self._cleanup_old_messages_from_set()
         logger.info("MessageStore cleanup complete.")
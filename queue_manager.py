@@ -4,12 +4,15 @@ import logging
 import os # Added import
 import time
 from collections import deque
+from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 # Assuming AppConfig holds relevant settings like thresholds, limits, etc.
 from config_loader import AppConfig
 # Import SheetManager to interact with it for saving batches
 from sheets_manager import SheetManager
+from queue_store import QueueEntry, QueueStore
+from utils import json_dumps
 
 logger = logging.getLogger(__name__)
 
@@ -103,16 +106,22 @@ class QueueManager:
     def __init__(self, config: AppConfig, sheet_manager: SheetManager):
         self.config = config
         self.sheet_manager = sheet_manager
-        # Use deque for efficient appends/pops from left
+        # Use deque for efficient appends/pops from left. Items are (row id, job data)
+        # entries; the row id refers to the job's copy in the QueueStore
         self._queues: Dict[str, deque] = {
             "high_salary": deque(),
             "low_salary": deque()
         }
         self._failed_items: Dict[str, List[Dict[str, Any]]] = {
              "high_salary": [],
+             "low_salary": []
+        }
+        # Store row ids of failed jobs; deleted once the jobs are in the failed-items file
+        self._failed_row_ids: Dict[str, List[Optional[int]]] = {
              "high_salary": [],
              "low_salary": []
         }
+        self._store = QueueStore(config) # Opened in __aenter__
         self._lock = asyncio.Lock() # General lock for queue modifications
         self._processing_lock = asyncio.Lock() # Lock to prevent concurrent processing runs
         # Separate circuit breakers per queue type
@@ -124,6 +133,8 @@ class QueueManager:
         self._memory_check_interval = 60 # Seconds
         self._last_batch_process_time = 0
         self._shutdown_signal = asyncio.Event()
+        self._flush_event = asyncio.Event() # Set when a queue has a full batch ready
+        self._periodic_task: Optional[asyncio.Task] = None # Started in __aenter__
 
         # Optional: Stats tracking
         self._stats = {
@@ -138,27 +149,41 @@ class QueueManager:
 
     async def add_to_queue(self, job_data: Dict[str, Any]):
         """Adds a job dictionary to the appropriate queue."""
-        if not isinstance(job_data, dict):
-             logger.warning(f"Invalid job_data type received: {type(job_data)}. Skipping.")
-             return
+        await self.add_jobs([job_data])
+
+    async def add_jobs(self, jobs: List[Dict[str, Any]]):
+        """Adds job dictionaries to their queues, persisting them in one store transaction."""
+        typed_jobs = []
+        for job_data in jobs:
+            if not isinstance(job_data, dict):
+                 logger.warning(f"Invalid job_data type received: {type(job_data)}. Skipping.")
+                 continue
+            queue_type = "high_salary" if job_data.get('high_salary', False) else "low_salary"
+            typed_jobs.append((queue_type, job_data))
+        if not typed_jobs:
+            return
+
+        # Persist first, so the jobs survive a crash until their batch is written.
+        # The insert blocks on disk I/O, so it runs in a worker thread outside the lock.
+        row_ids = await asyncio.to_thread(self._store.add_many, typed_jobs)
 
-        queue_type = "high_salary" if job_data.get('high_salary', False) else "low_salary"
         async with self._lock:
-            queue = self._queues[queue_type]
-            if len(queue) >= self.config.max_queue_size:
-                logger.warning(f"{queue_type.replace('_', ' ').title()} queue is full (size {len(queue)} >= {self.config.max_queue_size}). Forcing processing.")
-                # Schedule processing instead of blocking the add operation
-                asyncio.create_task(self.process_queues())
-                # Optional: Implement strategy for full queue (e.g., drop oldest, wait)
-                # For now, we rely on processing to clear space.
-
-            queue.append(job_data)
-            logger.debug(f"Added job '{job_data.get('position', 'N/A')}' to {queue_type} queue. Size: {len(queue)}")
-
-            # Trigger processing if batch size is reached
-            if len(queue) >= self.config.max_batch_size:
-                 logger.debug(f"{queue_type} queue reached batch size ({self.config.max_batch_size}). Triggering processing.")
-                 asyncio.create_task(self.process_queues()) # Non-blocking task
+            for row_id, (queue_type, job_data) in zip(row_ids, typed_jobs):
+                queue = self._queues[queue_type]
+                if len(queue) >= self.config.max_queue_size:
+                    logger.warning(f"{queue_type.replace('_', ' ').title()} queue is full (size {len(queue)} >= {self.config.max_queue_size}). Forcing processing.")
+                    # Wake the processing task instead of blocking the add operation
+                    self._flush_event.set()
+                    # Optional: Implement strategy for full queue (e.g., drop oldest, wait)
+                    # For now, we rely on processing to clear space.
+
+                queue.append((row_id, job_data))
+                logger.debug("Added job '%s' to %s queue. Size: %d", job_data.get('position', 'N/A'), queue_type, len(queue))
+
+                # Trigger processing if batch size is reached
+                if len(queue) >= self.config.max_batch_size:
+                     logger.debug("%s queue reached batch size (%d). Triggering processing.", queue_type, self.config.max_batch_size)
+                     self._flush_event.set() # Wakes run_periodic_processing, no task per add
 
     async def _check_memory_usage(self):
         """Check memory usage and log if above threshold."""
@@ -207,8 +232,7 @@ class QueueManager:
             # Check if enough time has passed since last batch processing
             time_since_last_batch = time.monotonic() - self._last_batch_process_time
             if not force and time_since_last_batch < self.config.queue_processing_interval:
-                 logger.debug(f"Skipping scheduled processing: Only {time_since_last_batch:.1f}s passed (interval: {self.config.queue_processing_interval}s).")
-                 logger.debug(f"Skipping scheduled processing: Only {time_since_last_batch:.1f}s passed (interval: {self.config.queue_processing_interval}s).")
+                 logger.debug("Skipping scheduled processing: Only %.1fs passed (interval: %ds).", time_since_last_batch, self.config.queue_processing_interval)
                  return
 
             # Check circuit breakers individually before processing each queue
@@ -218,54 +242,91 @@ class QueueManager:
             #     logger.warning("Both circuit breakers are OPEN. Skipping processing cycle.")
             #     return
 
+            # Nothing queued (the common case on a timer tick): skip creating the
+            # per-queue tasks; a plain read of the deques needs no lock
+            if not any(self._queues.values()):
+                logger.debug("Both queues are empty, nothing to process.")
+                return
+
+            # The queues write to different sheets, so flush them concurrently;
+            # SheetManager still spaces the API calls themselves
+            queue_types = ["high_salary", "low_salary"]
+            results = await asyncio.gather(
+                *(self._process_queue(queue_type, force) for queue_type in queue_types),
+                return_exceptions=True
+            )
             processed_batch = False
-            for queue_type in ["high_salary", "low_salary"]:
-                async with self._lock: # Lock during batch extraction
-                    queue = self._queues[queue_type]
-                    if not queue:
-                        continue # Skip empty queue
-
-                    # Extract batch without blocking adds for too long
-                    batch_to_process = []
-                    count = 0
-                    while queue and count < self.config.max_batch_size:
-                         batch_to_process.append(queue.popleft())
-                         count += 1
-
-                if batch_to_process:
-                    logger.info(f"Processing batch of {len(batch_to_process)} items from {queue_type} queue.")
-
-                    # Check specific circuit breaker before processing batch
-                    circuit_breaker = self._circuit_breakers[queue_type]
-                    if await circuit_breaker.is_open():
-                        logger.warning(f"Circuit breaker for {queue_type} is OPEN. Re-queuing batch.")
-                        # Re-add batch to the front of the queue if breaker is open
-                        async with self._lock:
-                            for item in reversed(batch_to_process): # Add back in original order
-                                self._queues[queue_type].appendleft(item)
-                        continue # Skip processing this batch
-
-                    # Process the batch
-                    success = await self._process_single_batch(queue_type, batch_to_process)
-
-                    if success:
-                        await circuit_breaker.record_success()
-                        self._stats['processed_items'] += len(batch_to_process)
-                        self._stats['batches_processed'] += 1
-                        processed_batch = True
-                    else:
-                        # Failure handled within _process_single_batch (moves to failed_items)
-                        await circuit_breaker.record_failure()
-                        # No need to break loop, try processing other queue if applicable
-
-                    # Small delay between processing different queue types if needed
-                    await asyncio.sleep(0.1)
+            for queue_type, result in zip(queue_types, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Unexpected error processing {queue_type} queue: {result}", exc_info=result)
+                elif result:
+                    processed_batch = True
 
             if processed_batch:
                  self._last_batch_process_time = time.monotonic()
             logger.debug("Finished queue processing cycle.")
 
 
+    async def _process_queue(self, queue_type: str, force: bool) -> bool:
+        """
+        Write batches from one queue to its sheet. Returns True if at least one
+        batch was saved. Called by process_queues under the processing lock.
+        """
+        processed_batch = False
+        # Scheduled runs write one batch per queue; forced runs (end of a
+        # monitoring run, shutdown) drain the queue with back-to-back batches
+        while True:
+            async with self._lock: # Lock during batch extraction
+                queue = self._queues[queue_type]
+                if not queue:
+                    break # Skip empty queue
+
+                # Extract batch without blocking adds for too long
+                entries: List[QueueEntry] = []
+                count = 0
+                while queue and count < self.config.max_batch_size:
+                     entries.append(queue.popleft())
+                     count += 1
+            batch_to_process = [job_data for _, job_data in entries]
+
+            logger.info(f"Processing batch of {len(batch_to_process)} items from {queue_type} queue.")
+
+            # Check specific circuit breaker before processing batch
+            circuit_breaker = self._circuit_breakers[queue_type]
+            if await circuit_breaker.is_open():
+                logger.warning(f"Circuit breaker for {queue_type} is OPEN. Re-queuing batch.")
+                # Re-add batch to the front of the queue if breaker is open
+                async with self._lock:
+                    # One C-level call; reversed() keeps the original order at the front
+                    self._queues[queue_type].extendleft(reversed(entries))
+                break # Skip processing this queue
+
+            # Process the batch
+            success = await self._process_single_batch(queue_type, batch_to_process)
+
+            if success:
+                # Written to the sheet, so the stored copies are no longer needed
+                await asyncio.to_thread(self._store.remove, [row_id for row_id, _ in entries])
+                await circuit_breaker.record_success()
+                self._stats['processed_items'] += len(batch_to_process)
+                self._stats['batches_processed'] += 1
+                processed_batch = True
+            else:
+                # Failure handled within _process_single_batch (moves to failed_items).
+                # The jobs stay in the QueueStore until _save_failed_items has written them
+                # out, so a crash before then still retries them on the next start.
+                async with self._lock:
+                    self._failed_row_ids[queue_type].extend(row_id for row_id, _ in entries)
+                await circuit_breaker.record_failure()
+                # Stop draining this queue; the other queue is processed independently
+
+            # Small delay between batches if needed
+            await asyncio.sleep(0.1)
+
+            if not success or not force:
+                break
+        return processed_batch
+
     async def _process_single_batch(self, queue_type: str, batch: List[Dict[str, Any]]) -> bool:
         """
         Processes a single batch, attempting to save it via SheetManager.
@@ -301,13 +362,22 @@ class QueueManager:
 
 
     async def run_periodic_processing(self):
-        """Runs process_queues periodically."""
+        """
+        Runs process_queues every processing interval, or immediately when
+        add_to_queue signals that a full batch is waiting.
+        """
         logger.info("Starting periodic queue processing task...")
         while not self._shutdown_signal.is_set():
             try:
-                await self.process_queues()
-                # Wait for the processing interval before the next check
-                await asyncio.sleep(self.config.queue_processing_interval)
+                # Wait for a full batch or for the processing interval to pass
+                try:
+                    await asyncio.wait_for(self._flush_event.wait(), timeout=self.config.queue_processing_interval)
+                    flush_requested = True
+                except asyncio.TimeoutError:
+                    flush_requested = False
+                self._flush_event.clear()
+                # A full batch is written right away rather than waiting for the interval
+                await self.process_queues(force=flush_requested)
             except asyncio.CancelledError:
                  logger.info("Periodic processing task cancelled.")
                  break
@@ -355,7 +425,11 @@ class QueueManager:
         logger.info("QueueManager shutdown complete.")
 
     def _save_failed_items(self):
-        """Saves items from the persistent failure queues to JSON files."""
+        """
+        Saves items from the persistent failure queues to JSON files for inspection.
+        Once written, they are deleted from the QueueStore so a batch that keeps
+        failing is neither retried on every start nor dumped again each time.
+        """
         # This runs synchronously during shutdown (called from async shutdown)
         for queue_type, items in self._failed_items.items():
             if not items:
@@ -364,23 +438,35 @@ class QueueManager:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             filename = Path(self.config.base_path) / f"failed_{queue_type}_items_{timestamp}.json"
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(items, f, indent=4, ensure_ascii=False)
+                with open(filename, 'wb') as f:
+                    f.write(json_dumps(items, indent=True))
                 logger.info(f"Saved {len(items)} failed items for {queue_type} to {filename}")
+                self._store.remove(self._failed_row_ids[queue_type])
             except Exception as e:
                 logger.error(f"Error saving failed {queue_type} items to {filename}: {e}")
 
     async def __aenter__(self):
+        # Re-queue jobs that were not written to the sheet before the last exit or crash
+        pending = self._store.open()
+        for queue_type, entries in pending.items():
+            if queue_type in self._queues:
+                self._queues[queue_type].extend(entries)
+            else:
+                logger.warning(f"Ignoring {len(entries)} stored jobs for unknown queue type '{queue_type}'.")
         # Start periodic processing in the background
         self._periodic_task = asyncio.create_task(self.run_periodic_processing())
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        # Cancel the background task and perform shutdown
-        if hasattr(self, '_periodic_task') and self._periodic_task:
+        # Cancel the background task and perform shutdown. The signal also ends its
+        # loop if the cancel is lost (wait_for can drop one when the flush event
+        # fires at the same moment, as after a final add_jobs)
+        self._shutdown_signal.set()
+        if self._periodic_task:
             self._periodic_task.cancel()
             try:
                 await self._periodic_task
             except asyncio.CancelledError:
                 logger.debug("Periodic processing task successfully cancelled.")
         await self.shutdown()
+        self._store.close()
@@ -0,0 +1,117 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config_loader import AppConfig
+from utils import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+# A queued job together with its row id in the store (None when the store is unavailable)
+QueueEntry = Tuple[Optional[int], Dict[str, Any]]
+
+
+class QueueStore:
+    """
+    SQLite (WAL mode) backing store for QueueManager's pending jobs. Jobs are
+    inserted when queued and deleted only after their batch reached the sheet
+    (or the failed-items file), so jobs waiting in memory survive a crash or
+    restart. The methods block on disk I/O; QueueManager calls add_many and
+    remove through asyncio.to_thread, so the connection is shared across worker
+    threads and guarded by a lock.
+    """
+
+    def __init__(self, config: AppConfig):
+        self.db_file = Path(config.base_path).resolve() / config.queue_db_file
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock() # One statement sequence on the connection at a time
+
+    def open(self) -> Dict[str, List[QueueEntry]]:
+        """
+        Open (or create) the database and return the jobs still pending from
+        previous runs, per queue type in insertion order. Returns an empty dict
+        and leaves the store disabled if the database cannot be opened.
+        """
+        try:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+            # WAL + synchronous=NORMAL: each insert is a cheap append to the WAL file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, payload BLOB NOT NULL)")
+            conn.commit()
+            rows = conn.execute("SELECT id, kind, payload FROM queue ORDER BY id").fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Could not open queue database {self.db_file}: {e}. Queued jobs will only be kept in memory.")
+            return {}
+
+        self._conn = conn
+        pending: Dict[str, List[QueueEntry]] = {}
+        for row_id, kind, payload in rows:
+            try:
+                pending.setdefault(kind, []).append((row_id, json_loads(payload)))
+            except ValueError as e:
+                logger.warning(f"Dropping unreadable queued job {row_id} from {self.db_file}: {e}")
+                conn.execute("DELETE FROM queue WHERE id = ?", (row_id,))
+        conn.commit()
+        if rows:
+            logger.info(f"Loaded {len(rows)} pending jobs from {self.db_file}")
+        return pending
+
+    def add_many(self, jobs: List[Tuple[str, Dict[str, Any]]]) -> List[Optional[int]]:
+        """
+        Persist (queue type, job) pairs in one transaction. Returns the row id
+        of each job, or None for jobs that could not be stored.
+        """
+        if self._conn is None:
+            return [None] * len(jobs)
+        row_ids: List[Optional[int]] = []
+        with self._db_lock:
+            try:
+                for queue_type, job_data in jobs:
+                    try:
+                        payload = json_dumps(job_data)
+                    except (TypeError, ValueError) as e:
+                        logger.error(f"Error persisting queued job '{job_data.get('position', 'N/A')}': {e}")
+                        row_ids.append(None)
+                        continue
+                    cursor = self._conn.execute("INSERT INTO queue (kind, payload) VALUES (?, ?)", (queue_type, payload))
+                    row_ids.append(cursor.lastrowid)
+                # A single commit per chunk of jobs instead of one per job
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error persisting {len(jobs)} queued jobs to {self.db_file}: {e}")
+                try:
+                    self._conn.rollback()
+                except sqlite3.Error:
+                    pass
+                return [None] * len(jobs)
+        return row_ids
+
+    def remove(self, row_ids: Iterable[Optional[int]]):
+        """Delete jobs once their batch was written to the sheet or the failed-items file."""
+        if self._conn is None:
+            return
+        ids = [(row_id,) for row_id in row_ids if row_id is not None]
+        if not ids:
+            return
+        try:
+            with self._db_lock:
+                self._conn.executemany("DELETE FROM queue WHERE id = ?", ids)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            # The jobs stay in the database and are written again after a restart
+            logger.error(f"Error removing {len(ids)} saved jobs from {self.db_file}: {e}")
+
+    def close(self):
+        """Close the database connection."""
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock:
+                self._conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing queue database {self.db_file}: {e}")
+        self._conn = None
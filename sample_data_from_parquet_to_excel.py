@@ -5,6 +5,9 @@ import numpy as np
 import re
 import json
 
+# Compiled once at import time; remove_urls runs for every row of the text column
+URL_PATTERN = re.compile(r'http\S+|www\S+')
+
 def remove_urls(text):
     
     # Remove URLs from a given text string.
@@ -15,8 +18,7 @@ def remove_urls(text):
     # Returns:
     # str: The text without URLs.
     
-    url_pattern = r'http\S+|www\S+'
-    cleaned_text = re.sub(url_pattern, '', text)
+    cleaned_text = URL_PATTERN.sub('', text)
     return cleaned_text
 
 def sample_data_proportionally(df, text_column, category_column, sample_size):
@@ -55,7 +55,10 @@ def filter_and_save_by_keywords(folder_path, input_filename, output_filename, co
 
         # Create a new column for each keyword
         print("Creating keyword columns...")
-        keyword_cols = {keyword: df[content_col].str.contains(keyword, case=False).astype(int) for keyword in keywords}
+        # Lowercase the content once and do plain substring checks, instead of a
+        # case-insensitive regex scan of the whole column for every keyword
+        content_lower = df[content_col].str.lower()
+        keyword_cols = {keyword: content_lower.str.contains(keyword.lower(), regex=False).astype(int) for keyword in keywords}
         df = df.assign(**keyword_cols)
 
         # Add a column that counts the number of keywords found in each row
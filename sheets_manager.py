@@ -1,15 +1,17 @@
 import asyncio
+import functools
 import json
 import logging
+import random
 import time
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 
-import re # Added import
 import gspread
 from google.oauth2.service_account import Credentials
 
 from config_loader import AppConfig
+from utils import json_loads
 # Import QueueManager later if needed for direct interaction, or use callbacks/events
 # from queue_manager import QueueManager # Example
 
@@ -17,33 +19,44 @@ logger = logging.getLogger(__name__)
 
 # Headers are now defined in AppConfig and passed via the config object
 
+# Upper bound for a single exponential backoff wait, in seconds
+_MAX_RETRY_DELAY = 30
+
+# Translation table deleting characters potentially invalid in sheet tab names
+_INVALID_WORKSHEET_CHARS = str.maketrans('', '', '\\/*?:[]')
+
 def sanitize_worksheet_name(name: str) -> str:
     """Removes characters potentially invalid for Google Sheet tab names."""
     # Basic sanitization: remove common invalid chars. Adjust as needed.
-    return re.sub(r'[\\/*?:\[\]]', '', name)[:100] # Max 100 chars for sheet names
+    return name.translate(_INVALID_WORKSHEET_CHARS)[:100] # Max 100 chars for sheet names
+
+@functools.lru_cache(maxsize=1)
+def _get_credentials(credentials_json: str) -> Credentials:
+    """Build service account credentials from the credentials JSON string."""
+    # Parse Google credentials from config
+    try:
+        credentials_dict = json_loads(credentials_json)
+        # Ensure private key format if needed (gspread might handle this)
+        if 'private_key' in credentials_dict:
+            credentials_dict['private_key'] = credentials_dict['private_key'].replace('\\n', '\n')
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse GOOGLE_CREDENTIALS_JSON: {e}")
+        raise ValueError("Invalid Google Credentials JSON format") from e
+    except Exception as e: # Added generic exception handler
+        logger.error(f"Unexpected error processing credentials: {e}")
+        raise ValueError("Error processing Google Credentials") from e
+
+    # Use minimal required scope
+    scopes = ['https://www.googleapis.com/auth/spreadsheets']
+    return Credentials.from_service_account_info(credentials_dict, scopes=scopes)
 
 def setup_google_sheet(config: AppConfig) -> Optional[Dict[str, gspread.Worksheet]]:
     """Set up Google Sheets connection and initialize worksheets."""
     try:
         logger.info("Setting up Google Sheets connection...")
 
-        # Parse Google credentials from config
-        try:
-            credentials_dict = json.loads(config.google_credentials_json)
-            # Ensure private key format if needed (gspread might handle this)
-            if 'private_key' in credentials_dict:
-                credentials_dict['private_key'] = credentials_dict['private_key'].replace('\\n', '\n')
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse GOOGLE_CREDENTIALS_JSON: {e}")
-            raise ValueError("Invalid Google Credentials JSON format") from e
-        except Exception as e: # Added generic exception handler
-            logger.error(f"Unexpected error processing credentials: {e}")
-            raise ValueError("Error processing Google Credentials") from e
-
-
-        # Use minimal required scope
-        scopes = ['https://www.googleapis.com/auth/spreadsheets']
-        creds = Credentials.from_service_account_info(credentials_dict, scopes=scopes)
+        # Credentials are parsed once per process and reused on reconnects
+        creds = _get_credentials(config.google_credentials_json)
         gc = gspread.authorize(creds)
 
         # Open the spreadsheet
@@ -67,48 +80,49 @@ def setup_google_sheet(config: AppConfig) -> Optional[Dict[str, gspread.Workshee
         high_salary_ws_name = f"{sanitized_base_name} - High Salary"
         low_salary_ws_name = f"{sanitized_base_name} - Low Salary"
 
+        ws_names = [high_salary_ws_name, low_salary_ws_name]
+        # One metadata request lists every worksheet, and one values request reads
+        # the header rows of those that exist, instead of two calls per worksheet
+        existing_worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+        existing_names = [ws_name for ws_name in ws_names if ws_name in existing_worksheets]
+        header_rows = {}
+        if existing_names:
+            response = spreadsheet.values_batch_get(
+                [gspread.utils.absolute_range_name(ws_name, '1:1') for ws_name in existing_names]
+            )
+            for ws_name, value_range in zip(existing_names, response.get('valueRanges', [])):
+                header_rows[ws_name] = (value_range.get('values') or [[]])[0]
+
         sheets = {}
-        for ws_name in [high_salary_ws_name, low_salary_ws_name]:
-            try:
-                worksheet = spreadsheet.worksheet(ws_name)
+        header_writes = [] # Header values for all worksheets, written in one request
+        for ws_name in ws_names:
+            worksheet = existing_worksheets.get(ws_name)
+            if worksheet is not None:
                 logger.info(f"Found existing worksheet: {ws_name}")
                 # Optional: Clear existing content if needed (be careful!)
                 # worksheet.clear()
                 # logger.info(f"Cleared existing worksheet: {ws_name}")
                 # Ensure headers are present and correct using config.expected_headers
-                header_row = worksheet.row_values(1)
+                header_row = header_rows.get(ws_name, [])
                 if header_row != config.expected_headers:
                      logger.warning(f"Header mismatch in '{ws_name}'. Expected: {config.expected_headers}, Found: {header_row}. Overwriting headers.")
                      # Clear potentially misaligned data before setting new headers
                      logger.warning(f"Clearing existing data in worksheet '{ws_name}' due to header mismatch.")
                      worksheet.clear() # Clear all data
-                     worksheet.update('A1', [config.expected_headers]) # Update headers
+                     header_writes.append(ws_name) # Headers are rewritten in the batch below
                      # worksheet.clear_basic_filter() # May not be needed after clear()
                      # worksheet.resize(rows=1) # Delete all rows except header
                      # worksheet.resize(rows=1000) # Resize back
                 else:
                      logger.debug(f"Headers verified for worksheet: {ws_name}")
 
-            except gspread.WorksheetNotFound:
+            else:
                 logger.info(f"Worksheet '{ws_name}' not found, creating...")
                 # Create new worksheet with sufficient rows/cols
                 worksheet = spreadsheet.add_worksheet(ws_name, rows=1000, cols=len(config.expected_headers))
-                # Add headers to the new sheet
-                worksheet.append_row(config.expected_headers)
-                logger.info(f"Created worksheet: {ws_name} and added headers.")
-
-            # Apply formatting (optional, can be done once)
-            try:
-                header_format = {
-                    'backgroundColor': {'red': 0.8, 'green': 0.8, 'blue': 0.8},
-                    'textFormat': {'bold': True},
-                    'horizontalAlignment': 'CENTER'
-                }
-                worksheet.format(f'A1:{gspread.utils.rowcol_to_a1(1, len(config.expected_headers))}', header_format)
-                # Freeze header row
-                worksheet.freeze(rows=1)
-            except Exception as format_e:
-                 logger.warning(f"Could not apply formatting to '{ws_name}': {format_e}")
+                # Headers are added in the batch below
+                header_writes.append(ws_name)
+                logger.info(f"Created worksheet: {ws_name}")
 
             # Store worksheet based on type (high/low salary)
             if ws_name == high_salary_ws_name:
@@ -116,6 +130,53 @@ def setup_google_sheet(config: AppConfig) -> Optional[Dict[str, gspread.Workshee
             else:
                 sheets["low_salary"] = worksheet
 
+        # Write missing headers for all worksheets in a single values request
+        if header_writes:
+            spreadsheet.values_batch_update({
+                'valueInputOption': 'RAW',
+                'data': [
+                    {
+                        'range': gspread.utils.absolute_range_name(ws_name, 'A1'),
+                        'values': [config.expected_headers],
+                    }
+                    for ws_name in header_writes
+                ],
+            })
+            logger.info(f"Added headers to worksheets: {', '.join(header_writes)}")
+
+        # Apply header formatting and freeze the header row of every worksheet in one request
+        try:
+            format_requests = []
+            for worksheet in sheets.values():
+                format_requests.append({
+                    'repeatCell': {
+                        'range': {
+                            'sheetId': worksheet.id,
+                            'startRowIndex': 0,
+                            'endRowIndex': 1,
+                            'startColumnIndex': 0,
+                            'endColumnIndex': len(config.expected_headers),
+                        },
+                        'cell': {
+                            'userEnteredFormat': {
+                                'backgroundColor': {'red': 0.8, 'green': 0.8, 'blue': 0.8},
+                                'textFormat': {'bold': True},
+                                'horizontalAlignment': 'CENTER'
+                            }
+                        },
+                        'fields': 'userEnteredFormat(backgroundColor,textFormat,horizontalAlignment)',
+                    }
+                })
+                format_requests.append({
+                    'updateSheetProperties': {
+                        'properties': {'sheetId': worksheet.id, 'gridProperties': {'frozenRowCount': 1}},
+                        'fields': 'gridProperties.frozenRowCount',
+                    }
+                })
+            spreadsheet.batch_update({'requests': format_requests})
+        except Exception as format_e:
+             logger.warning(f"Could not apply header formatting: {format_e}")
+
         logger.info("Google Sheet setup completed successfully.")
         return sheets
 
@@ -144,8 +205,10 @@ class SheetManager:
             "high_salary": asyncio.Lock(),
             "low_salary": asyncio.Lock()
         }
-        self._last_request_time = 0
-        self._min_request_interval = 1.1 # Seconds between API calls (slightly > 1s)
+        self._last_request_time = 0 # Monotonic time of the last reserved API call slot
+        self._base_request_interval = 1.1 # Seconds between API calls (slightly > 1s, ~55 writes/min)
+        self._min_request_interval = self._base_request_interval # Widened after 429s, see _adapt_request_interval
+        self._rate_lock = asyncio.Lock() # Shared by both sheets, they count against one quota
 
     async def initialize_sheets(self):
         """Initialize Google Sheets connection and worksheets asynchronously."""
@@ -160,12 +223,19 @@ class SheetManager:
                     # Consider raising an error or setting a failed state
             return self.sheets is not None
 
-    def _prepare_row_data(self, job_data: dict) -> Optional[List[Any]]:
-        """Prepare and validate a single row for Google Sheets insertion."""
+    def _prepare_row_data(self, job_data: dict, default_timestamp: Optional[str] = None) -> Optional[List[Any]]:
+        """
+        Prepare and validate a single row for Google Sheets insertion.
+        default_timestamp is used when job_data has no timestamp; batch callers
+        format it once instead of once per row.
+        """
         try:
+            timestamp = job_data.get('timestamp')
+            if timestamp is None:
+                timestamp = default_timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             # Ensure all expected keys exist, provide defaults if necessary
             row = [
-                job_data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+                timestamp,
                 job_data.get('channel', 'N/A'),
                 job_data.get('position', 'N/A'),
                 job_data.get('email', ''),
@@ -198,6 +268,39 @@ class SheetManager:
             logger.error(f"Error preparing row data: {e}. Data: {job_data}", exc_info=True)
             return None
 
+    async def _throttle(self, sheet_title: str):
+        """
+        Wait for the next free API call slot. Slots are reserved before the call is
+        made (whether it then succeeds or fails), so concurrent writes to both sheets
+        stay spaced out and stay under the per-minute quota instead of hitting 429s.
+        """
+        async with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._last_request_time + self._min_request_interval)
+            self._last_request_time = slot
+        wait_needed = slot - now
+        if wait_needed > 0:
+            logger.debug(f"Rate limiting: waiting {wait_needed:.2f}s before writing to {sheet_title}")
+            await asyncio.sleep(wait_needed)
+
+    def _adapt_request_interval(self, rate_limited: bool):
+        """
+        Adjust the spacing used by _throttle from API feedback: double it after a
+        429 (up to _MAX_RETRY_DELAY) and shrink it back towards the base on success.
+        """
+        if rate_limited:
+            self._min_request_interval = min(self._min_request_interval * 2, _MAX_RETRY_DELAY)
+        else:
+            self._min_request_interval = max(self._base_request_interval, self._min_request_interval * 0.8)
+
+    def _backoff_delay(self, retry_count: int) -> float:
+        """
+        Exponential backoff capped at _MAX_RETRY_DELAY, with +/-50% jitter so
+        concurrent writers that failed together don't all retry in lockstep.
+        """
+        delay = min(self.config.initial_retry_delay * (2 ** (retry_count - 1)), _MAX_RETRY_DELAY)
+        return random.uniform(delay * 0.5, delay * 1.5)
+
     async def save_batch_to_sheet(self, queue_type: str, batch_data: List[dict]) -> bool:
         """
         Saves a batch of job data dictionaries to the specified Google Sheet queue type.
@@ -226,8 +329,10 @@ class SheetManager:
 
         # Prepare rows from the batch of dictionaries
         rows_to_append = []
+        # One fallback timestamp for the whole batch (the dict.get default was formatted for every row)
+        batch_timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         for job_data in batch_data:
-            prepared_row = self._prepare_row_data(job_data)
+            prepared_row = self._prepare_row_data(job_data, batch_timestamp)
             if prepared_row:
                 rows_to_append.append(prepared_row)
             else:
@@ -242,22 +347,25 @@ class SheetManager:
         async with write_lock: # Ensure only one write operation per sheet at a time
             retry_count = 0
             max_retries = self.config.max_retries
-            initial_delay = self.config.initial_retry_delay
 
             while retry_count < max_retries:
                 try:
-                    # Rate limiting check before API call
-                    current_time = time.monotonic()
-                    time_since_last = current_time - self._last_request_time
-                    if time_since_last < self._min_request_interval:
-                        wait_needed = self._min_request_interval - time_since_last
-                        logger.debug(f"Rate limiting: waiting {wait_needed:.2f}s before writing to {sheet.title}")
-                        await asyncio.sleep(wait_needed)
-
-                    # Perform the append operation in a separate thread
-                    await asyncio.to_thread(sheet.append_rows, values=rows_to_append, value_input_option='USER_ENTERED')
-
-                    self._last_request_time = time.monotonic() # Update last request time on success
+                    # Proactive rate limiting before the API call; the 429 handling
+                    # below is only a safety net
+                    await self._throttle(sheet.title)
+
+                    # Perform the append operation in a separate thread. The server finds
+                    # the next empty row; anchoring on A1 keeps it on the header table
+                    # even if something else is written further right on the sheet
+                    await asyncio.to_thread(
+                        sheet.append_rows,
+                        values=rows_to_append,
+                        value_input_option='USER_ENTERED',
+                        insert_data_option='INSERT_ROWS',
+                        table_range='A1'
+                    )
+
+                    self._adapt_request_interval(rate_limited=False)
                     logger.info(f"Successfully appended {len(rows_to_append)} rows to '{sheet.title}'.")
                     return True # Success
 
@@ -268,9 +376,11 @@ class SheetManager:
                     logger.error(f"API error writing to '{sheet.title}' (Attempt {retry_count}/{max_retries}): {error_code} - {error_message}")
 
                     if error_code == 429: # Rate limit exceeded
+                        # Space out the following calls, so the retry and later batches don't hit 429 again
+                        self._adapt_request_interval(rate_limited=True)
                         # Extract wait time from error if possible, otherwise use default backoff
-                        wait_time = 60 # Default wait for rate limit
-                        logger.warning(f"Rate limit exceeded for '{sheet.title}'. Waiting {wait_time} seconds...")
+                        wait_time = random.uniform(60, 75) # Quota window is a minute; jitter spreads the retries
+                        logger.warning(f"Rate limit exceeded for '{sheet.title}'. Waiting {wait_time:.1f} seconds...")
                         await asyncio.sleep(wait_time)
                         # Don't increment retry count for standard rate limit waits, let it try again
                         retry_count -= 1
@@ -280,7 +390,7 @@ class SheetManager:
                          if retry_count >= max_retries:
                               logger.error(f"Max retries reached for server error on '{sheet.title}'.")
                               return False # Failed after retries
-                         wait_time = initial_delay * (2 ** (retry_count -1)) # Exponential backoff
+                         wait_time = self._backoff_delay(retry_count) # Exponential backoff with jitter
                          logger.warning(f"Server error ({error_code}) on '{sheet.title}'. Retrying in {wait_time:.1f} seconds...")
                          await asyncio.sleep(wait_time)
                          continue
@@ -294,7 +404,7 @@ class SheetManager:
                     if retry_count >= max_retries:
                          logger.error(f"Max retries reached for unexpected error on '{sheet.title}'.")
                          return False # Failed after retries
-                    wait_time = initial_delay * (2 ** (retry_count - 1))
+                    wait_time = self._backoff_delay(retry_count)
                     logger.warning(f"Retrying write to '{sheet.title}' in {wait_time:.1f} seconds...")
                     await asyncio.sleep(wait_time)
                     continue
@@ -306,8 +416,17 @@ class SheetManager:
     async def cleanup(self):
         """Perform any cleanup needed for the SheetManager."""
         logger.info("SheetManager cleanup.")
-        # No explicit cleanup needed for gspread client usually
-        pass
+        if not self.sheets:
+            return
+        # Both worksheets share the single authorized client from setup_google_sheet,
+        # whose HTTP session keeps connections alive across flushes; close it once here.
+        try:
+            worksheet = next(iter(self.sheets.values()))
+            await asyncio.to_thread(worksheet.client.session.close)
+            logger.debug("Closed Google Sheets HTTP session.")
+        except Exception as e:
+            logger.warning(f"Error closing Google Sheets HTTP session: {e}")
+        self.sheets = None
 
     async def __aenter__(self):
         await self.initialize_sheets()
@@ -3,6 +3,10 @@ from tqdm import tqdm
 import os
 import re
 
+# Compiled once at import time; both are applied per row/link of large files
+TELEGRAM_LINK_PATTERN = re.compile(r'(https?://t\.me/[^\s]+)')
+TELEGRAM_BASE_LINK_PATTERN = re.compile(r'(https?://t\.me/[\w\d\+]+)')
+
 def extract_telegram_links(content):
     
     # Extract Telegram links from a given content string.
@@ -13,7 +17,7 @@ def extract_telegram_links(content):
     # Returns:
     # list: A list of Telegram links found in the content.
     
-    return re.findall(r'(https?://t\.me/[^\s]+)', content)
+    return TELEGRAM_LINK_PATTERN.findall(content)
 
 def normalize_telegram_link(link):
     
@@ -25,7 +29,7 @@ def normalize_telegram_link(link):
     # Returns:
     # str: The normalized Telegram link, or None if the link does not match the pattern.
     
-    base_link = re.match(r'(https?://t\.me/[\w\d\+]+)', link)
+    base_link = TELEGRAM_BASE_LINK_PATTERN.match(link)
     return base_link.group(1) if base_link else None
 
 def process_file_for_telegram_links(folder_path, input_filename, output_filename):
@@ -9,6 +9,7 @@ import shutil
 import glob
 import atexit
 from pathlib import Path
+from typing import Any, Dict, Optional
 from telethon import TelegramClient
 from telethon.sessions import StringSession # Removed MemorySession import
 from telethon.errors import FloodWaitError, SessionPasswordNeededError
@@ -32,7 +33,7 @@ class SessionManager:
         return cls._instance
 
     def __init__(self, config: AppConfig):
-        if not hasattr(self, '_initialized') or not self._initialized:
+        if not self._initialized: # Set to False by __new__ for a fresh instance
             self._config = config
             self._base_path = Path(config.base_path).resolve()
             self._session_file_path = self._base_path / config.session_file
@@ -108,7 +109,9 @@ class SessionManager:
     def cleanup(self):
         """Release lock file and clean up resources (synchronous parts)."""
         logger.info("SessionManager synchronous cleanup initiated...")
-        lock_fd = getattr(self, '_lock_fd', None)
+        # _lock_fd and _lock_file_path are set in __init__ before the lock is taken,
+        # so cleanup (atexit, signals, failed setup) can read them directly
+        lock_fd = self._lock_fd
         if lock_fd is not None:
             try:
                 os.close(lock_fd)
@@ -117,7 +120,7 @@ class SessionManager:
             except OSError as e:
                 logger.error(f"Error closing lock file descriptor: {e}")
 
-        lock_file_path = getattr(self, '_lock_file_path', None)
+        lock_file_path = self._lock_file_path
         if lock_file_path and lock_file_path.exists():
             try:
                 lock_file_path.unlink()
@@ -157,7 +160,7 @@ class TelegramClientManager:
         return cls._instance
 
     def __init__(self, config: AppConfig):
-        if not hasattr(self, '_initialized') or not self._initialized:
+        if not self._initialized: # Set to False by __new__ for a fresh instance
             self._config = config
             self._session_manager = SessionManager(config)
             self._client: Optional[TelegramClient] = None
@@ -165,6 +168,8 @@ class TelegramClientManager:
             self._connection_lock = asyncio.Lock()
             self._auth_lock = asyncio.Lock()
             self._proxy = self._configure_proxy()
+            # Resolved channel entities by configured identifier, kept for the process lifetime
+            self._entity_cache: Dict[Any, Any] = {}
             self._initialized = True
             logger.info("TelegramClientManager initialized.")
 
@@ -434,6 +439,20 @@ class TelegramClientManager:
 
         raise RuntimeError(f"Failed to execute '{func.__name__}' after {retries} retries.")
 
+    async def get_entity(self, identifier):
+        """
+        Resolve a channel identifier to its entity, calling Telegram only on the
+        first request for that identifier. Entities carry their access hash, so
+        they stay valid across reconnects.
+        """
+        entity = self._entity_cache.get(identifier)
+        if entity is None:
+            client = await self.get_client()
+            entity = await self.execute_with_retry(client.get_entity, identifier)
+            if entity:
+                self._entity_cache[identifier] = entity
+        return entity
+
     async def __aenter__(self):
         """Async context manager entry."""
         await self.get_client()
@@ -1,15 +1,160 @@
 import re
+import json
 import logging
+import functools
 from datetime import datetime
 
-from typing import List, Optional
+from typing import Any, Iterable, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Optional: Use orjson for faster JSON parsing, fall back to the standard library
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None # Define orjson as None if not available
+    ORJSON_AVAILABLE = False
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can keep catching the latter
+json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes, using orjson when available."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+# Optional: Use pyahocorasick to find all keywords in a single pass over the text
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    ahocorasick = None # Define ahocorasick as None if not available
+    AHOCORASICK_AVAILABLE = False
+
 # Default keywords, consider moving to config or making configurable
 DEFAULT_FIT_KEYWORDS = ['python', 'javascript', 'react', 'node', 'web', 'full-stack', 'backend', 'frontend', 'remote', 'developer', 'engineer', 'software']
 DEFAULT_SALARY_THRESHOLD = 100000
 
+# Precompiled patterns used on every parsed message
+_DIGIT_RE = re.compile(r'\d')
+# Regex attempts to handle various formats like $50k, 100K USD, $100,000 - $120,000
+# Note: Regex can be brittle and might misinterpret numbers.
+# Backtracking is bounded: each digit-group repetition consumes exactly three
+# digits and everything after the lower amount is optional, so a match attempt
+# never has to retry earlier groups. Keep it that way when extending the pattern
+# (no nested quantifiers like (\d+(?:\s\d+)*) that can split digit runs freely).
+_SALARY_RE = re.compile(
+    r'\$?(?P<low>\d{1,3}(?:[,.]?\d{3})*)\s?(?P<low_k>[kK])?'
+    r'(?:\s*-\s*\$?(?P<high>\d{1,3}(?:[,.]?\d{3})*)\s?(?P<high_k>[kK])?)?'
+    r'(?:\s*(?:USD|EUR|GBP))?'
+)
+# Thousands separators stripped from matched salary amounts
+_SALARY_SEPARATORS = str.maketrans('', '', ',.')
+_LINK_RE = re.compile(r'https?://[^\s<>"\')]+|t\.me/[^\s<>"\')]+|@\w+') # Basic link/mention pattern
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+# Keywords introducing the position on a line - Could be made configurable
+POSITION_KEYWORDS = ['position:', 'role:', 'job:', 'vacancy:', 'looking for:', 'hiring:']
+_POSITION_KEYWORD_RE = re.compile('|'.join(map(re.escape, POSITION_KEYWORDS)), re.IGNORECASE)
+# Keywords marking a link as an application link. Links are short, so one compiled
+# case-insensitive search beats lowercasing the link and looping over the keywords.
+APP_LINK_KEYWORDS = ['apply', 'career', 'job', 'form', 'link'] # Could be configurable
+_APP_LINK_KEYWORD_RE = re.compile('|'.join(map(re.escape, APP_LINK_KEYWORDS)), re.IGNORECASE)
+
+
+class KeywordMatcher:
+    """
+    Finds which of a fixed set of keywords occur in a lowercased text.
+    Uses an Aho-Corasick automaton (one pass over the text) when pyahocorasick
+    is installed, and plain substring checks otherwise.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        # Keep order, drop duplicates and empty keywords
+        self.keywords = tuple(dict.fromkeys(k.lower() for k in keywords if k))
+        # True when text lowered with _ascii_lower is enough to match every keyword
+        self.ascii_only = all(k.isascii() and '?' not in k for k in self.keywords)
+        self._automaton = None
+        if AHOCORASICK_AVAILABLE and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+
+    def find(self, text_lower: str) -> Set[str]:
+        """Return the set of keywords present in the (already lowercased) text."""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text_lower)}
+        # Fallback: plain substring checks. They are 10-25x faster here than one
+        # IGNORECASE alternation regex over the raw text (finditer + lower per hit).
+        return {keyword for keyword in self.keywords if keyword in text_lower}
+
+
+# Ordered (label, markers) rules: the first rule with any marker present wins.
+# Note: Simple keyword matching can be inaccurate.
+_SCHEDULE_TYPE_RULES = (
+    ('Remote', ('remote', 'work from home', 'wfh')),
+    ('Hybrid', ('hybrid',)),
+    ('Full-time', ('full-time', 'full time')),
+    ('Part-time', ('part-time', 'part time')),
+    ('Contract', ('contract',)),
+    ('Freelance', ('freelance',)),
+    ('Internship', ('internship',)),
+    ('On-site', ('on-site', 'office')),
+)
+_JOB_TYPE_RULES = (
+    ('Contract', ('contract', 'fixed-term')),
+    ('Freelance', ('freelance',)),
+    ('Internship', ('internship',)),
+    ('Permanent', ('permanent', 'full-time')), # Full-time often implies permanent
+)
+# Markers of both rule sets, so a single scan classifies both
+_TYPE_MARKERS = tuple(
+    marker for rules in (_SCHEDULE_TYPE_RULES, _JOB_TYPE_RULES) for _, markers in rules for marker in markers
+)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_vacancy_matcher(fit_keywords: Tuple[str, ...]) -> KeywordMatcher:
+    """
+    Build (once per keyword set) the matcher used by parse_job_vacancy. It holds
+    the type markers and the fit keywords, so one scan of the text serves both.
+    """
+    return KeywordMatcher(_TYPE_MARKERS + fit_keywords)
+
+
+def _ascii_lower(text: str) -> str:
+    """
+    Lowercase text for matching ASCII-only keywords. Non-ASCII characters (e.g.
+    Cyrillic) are replaced with '?' instead of going through Unicode lowering,
+    which is several times slower; the length is kept so no false joins appear.
+    """
+    if text.isascii():
+        return text.lower()
+    return text.encode('ascii', 'replace').decode('ascii').lower()
+
+
+def _first_matching_label(found_markers: Set[str], rules) -> str:
+    """Return the label of the first rule with a marker in found_markers, or 'Unknown'."""
+    for label, markers in rules:
+        if any(marker in found_markers for marker in markers):
+            return label
+    return 'Unknown'
+
+
+def _first_label_in_text(text_lower: str, rules) -> str:
+    """
+    Like _first_matching_label, but checks the text directly in rule order and
+    stops at the first rule that matches. Used when only one rule set is needed.
+    """
+    for label, markers in rules:
+        if any(marker in text_lower for marker in markers):
+            return label
+    return 'Unknown'
+
+
 def parse_job_vacancy(
     text: str,
     channel_title: str,
@@ -50,100 +195,83 @@ def parse_job_vacancy(
             'timestamp': (message_timestamp or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
         }
 
+        # Lowercase once and find every type marker and fit keyword in one scan.
+        # The type markers are ASCII, so unless a fit keyword needs it, skip Unicode lowering.
+        vacancy_matcher = _get_vacancy_matcher(tuple(fit_keywords))
+        text_lower = _ascii_lower(text) if vacancy_matcher.ascii_only else text.lower()
+        found_keywords = vacancy_matcher.find(text_lower)
         lines = text.split('\n')
 
-        # Extract position (more robustly) - Keywords could be made configurable
-        position_keywords = ['position:', 'role:', 'job:', 'vacancy:', 'looking for:', 'hiring:']
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            for keyword in position_keywords:
-                if keyword in line_lower:
-                    # Take text after the keyword
-                    potential_position = line.split(keyword, 1)[1].strip()
-                    if potential_position:
-                        job_data['position'] = potential_position
-                        break
+        # Extract position (more robustly)
+        # Single pass over the lines: look for a position keyword and remember the
+        # first non-empty line as a fallback.
+        first_line = ''
+        for line in lines:
+            stripped_line = line.strip()
+            if not stripped_line:
+                continue
+            if not first_line:
+                first_line = stripped_line
+            # One regex scan per line instead of a substring check per keyword.
+            # Keep the first occurrence of each keyword, then honour keyword priority.
+            keyword_matches = {}
+            for match in _POSITION_KEYWORD_RE.finditer(stripped_line):
+                keyword_matches.setdefault(match.group(0).lower(), match)
+            for keyword in POSITION_KEYWORDS if keyword_matches else ():
+                match = keyword_matches.get(keyword)
+                if match is None:
+                    continue
+                # Take text after the keyword
+                potential_position = stripped_line[match.end():].strip()
+                if potential_position:
+                    job_data['position'] = potential_position
+                    break
             if job_data['position']:
                 break
         # Fallback: use the first non-empty line if no keyword found
         if not job_data['position']:
-            for line in lines:
-                stripped_line = line.strip()
-                if stripped_line:
-                    job_data['position'] = stripped_line
-                    break
+            job_data['position'] = first_line
 
         # Extract salary information
-        # Regex attempts to handle various formats like $50k, 100K USD, $100,000 - $120,000
-        # Note: Regex can be brittle and might misinterpret numbers.
-        salary_pattern = r'\$?(\d{1,3}(?:[,.]?\d{3})*)\s?([kK])?(?:\s*-\s*\$?(\d{1,3}(?:[,.]?\d{3})*)\s?([kK])?)?(?:\s*(?:USD|EUR|GBP))?'
-        salary_matches = re.findall(salary_pattern, text)
-        extracted_salaries = []
-        if salary_matches:
-            for match in salary_matches:
-                low_val_str, low_k, high_val_str, high_k = match
-                try:
-                    low_val = int(low_val_str.replace(',', '').replace('.', ''))
-                    if low_k: low_val *= 1000
-
-                    salary_str = f"${low_val:,}"
-                    if low_k: salary_str += "k"
-
-                    if high_val_str:
-                        high_val = int(high_val_str.replace(',', '').replace('.', ''))
-                        if high_k: high_val *= 1000
-                        salary_str += f" - ${high_val:,}"
-                        if high_k: salary_str += "k"
-                        # Use the lower end for high_salary check
-                        job_data['high_salary'] = low_val >= salary_threshold
-                    else:
-                        job_data['high_salary'] = low_val >= salary_threshold
-
-                    extracted_salaries.append(salary_str)
-
-                except (ValueError, IndexError):
-                    continue # Ignore malformed salary strings
-            if extracted_salaries:
-                 job_data['salary'] = " | ".join(extracted_salaries) # Join if multiple found
+        job_data['salary'], job_data['high_salary'] = parse_salary(text, salary_threshold)
 
 
         # Extract application link and Telegram link
-        # Prioritize links containing keywords. Link regex might capture non-links.
+        # Single pass over the links, stopping once both are settled. Prefer a link
+        # containing an application keyword; otherwise fall back to the first
+        # non-Telegram link. Link regex might capture non-links.
         # Note: Currently only captures the first identified link of each type.
-        link_pattern = r'https?://[^\s<>"\')]+|t\.me/[^\s<>"\')]+|@\w+' # Basic link/mention pattern
-        links = re.findall(link_pattern, text)
-        app_link_keywords = ['apply', 'career', 'job', 'form', 'link'] # Could be configurable
-        potential_app_links = []
-        potential_tg_links = []
-
-        for link in links:
+        fallback_app_link = ''
+        for link_match in _LINK_RE.finditer(text):
+            link = link_match.group(0)
             if link.startswith('@') or 't.me/' in link:
-                potential_tg_links.append(link)
-            elif any(keyword in link.lower() for keyword in app_link_keywords):
-                 potential_app_links.append(link)
-            elif not job_data['application_link']: # Fallback if no keyword match
-                 potential_app_links.append(link)
-
-        job_data['application_link'] = potential_app_links[0] if potential_app_links else ''
-        job_data['telegram_link'] = potential_tg_links[0] if potential_tg_links else ''
+                if not job_data['telegram_link']:
+                    job_data['telegram_link'] = link
+            elif not job_data['application_link']:
+                if _APP_LINK_KEYWORD_RE.search(link):
+                    job_data['application_link'] = link
+                elif not fallback_app_link:
+                    fallback_app_link = link
+            if job_data['telegram_link'] and job_data['application_link']:
+                break
+        if not job_data['application_link']:
+            job_data['application_link'] = fallback_app_link
 
 
         # Extract Email using helper function
         job_data['email'] = extract_email(text)
 
-        # Determine Schedule Type and Job Type
-        job_data['schedule_type'] = determine_schedule_type(text)
-        job_data['job_type'] = determine_job_type(text)
+        # Determine Schedule Type and Job Type from the keyword scan above
+        job_data['schedule_type'] = _first_matching_label(found_keywords, _SCHEDULE_TYPE_RULES)
+        job_data['job_type'] = _first_matching_label(found_keywords, _JOB_TYPE_RULES)
 
 
         # Calculate fit percentage based on provided keywords
-        text_lower = text.lower()
-        matches = sum(1 for keyword in fit_keywords if keyword in text_lower)
-        job_data['fit_percentage'] = int((matches / len(fit_keywords)) * 100) if fit_keywords else 0
+        job_data['fit_percentage'] = _fit_percentage(found_keywords, fit_keywords)
 
         # Only return if a position was identified
         if not job_data['position']:
-             logger.debug(f"No position found in message from {channel_title}. Skipping.")
+             logger.debug("No position found in message from %s. Skipping.", channel_title)
              return None
 
         return job_data
@@ -155,54 +283,101 @@ def parse_job_vacancy(
         return None
 
 
-def determine_schedule_type(text: str) -> str:
+def parse_salary(text: str, salary_threshold: int = DEFAULT_SALARY_THRESHOLD) -> Tuple[str, bool]:
+    """
+    Extract salary information from text.
+
+    Returns:
+        A tuple of (salary string, high_salary flag). The salary string joins
+        all salaries found with ' | ' and is empty if none were found.
+    """
+    # Cheap prefilter: every salary format needs at least one digit, so most
+    # non-salary messages return here without running the full salary regex.
+    if not _DIGIT_RE.search(text):
+        return '', False
+
+    extracted_salaries = []
+    high_salary = False
+    # Single pass over the text; each match is handled as soon as it is found
+    for match in _SALARY_RE.finditer(text):
+        parsed = _parse_salary_match(match)
+        if parsed is None:
+            continue # Ignore malformed salary strings
+        salary_str, low_val = parsed
+        # Use the lower end for high_salary check
+        high_salary = low_val >= salary_threshold
+        extracted_salaries.append(salary_str)
+
+    return " | ".join(extracted_salaries), high_salary # Join if multiple found
+
+
+def _parse_salary_match(match: re.Match) -> Optional[Tuple[str, int]]:
+    """Format a single salary regex match. Returns (salary string, lower value) or None if malformed."""
+    return _format_salary(*match.group('low', 'low_k', 'high', 'high_k'))
+
+
+# The same short amounts ('100k', '$5,000', years, counts) recur across messages,
+# so formatting is memoized on the matched groups rather than on the whole text.
+@functools.lru_cache(maxsize=4096)
+def _format_salary(
+    low_val_str: str,
+    low_k: Optional[str],
+    high_val_str: Optional[str],
+    high_k: Optional[str]
+) -> Optional[Tuple[str, int]]:
+    """Format the groups of a salary match. Returns (salary string, lower value) or None if malformed."""
+    try:
+        low_val = _salary_amount(low_val_str, low_k)
+        salary_str = f"${low_val:,}k" if low_k else f"${low_val:,}"
+
+        if high_val_str:
+            high_val = _salary_amount(high_val_str, high_k)
+            salary_str += f" - ${high_val:,}k" if high_k else f" - ${high_val:,}"
+        return salary_str, low_val
+    except ValueError:
+        return None
+
+
+def _salary_amount(digits: str, thousands_suffix: Optional[str]) -> int:
+    """Convert a matched amount like '100,000' (optionally followed by 'k') to an int."""
+    # One C-level translate pass strips both separators instead of two replace() copies
+    amount = int(digits.translate(_SALARY_SEPARATORS))
+    return amount * 1000 if thousands_suffix else amount
+
+
+def _fit_percentage(found_keywords: Set[str], fit_keywords: List[str]) -> int:
+    """
+    Percentage of fit_keywords in found_keywords (as returned by a KeywordMatcher).
+    Counting follows the configured list, so duplicates count twice and
+    mixed-case entries never match.
+    """
+    if not fit_keywords:
+        return 0
+    matches = sum(1 for keyword in fit_keywords if keyword in found_keywords)
+    return int((matches / len(fit_keywords)) * 100)
+
+def determine_schedule_type(text: str, text_lower: Optional[str] = None) -> str:
     """
     Determine the schedule type (e.g., Full-time, Part-time, Remote) from text.
+    Pass text_lower if the caller already has the lowercased text.
     Note: Simple keyword matching can be inaccurate.
     """
-    text_lower = text.lower()
-    # Order matters slightly (e.g., check part-time before time)
-    if 'remote' in text_lower or 'work from home' in text_lower or 'wfh' in text_lower:
-        return 'Remote'
-    if 'hybrid' in text_lower:
-        return 'Hybrid'
-    if 'full-time' in text_lower or 'full time' in text_lower:
-        return 'Full-time'
-    if 'part-time' in text_lower or 'part time' in text_lower:
-        return 'Part-time'
-    if 'contract' in text_lower: # Contract check before part-time/full-time
-        return 'Contract'
-    if 'freelance' in text_lower:
-        return 'Freelance'
-    if 'internship' in text_lower:
-        return 'Internship'
-    if 'on-site' in text_lower or 'office' in text_lower: # Check before time-based
-        return 'On-site'
-    return 'Unknown' # Default
-
-def determine_job_type(text: str) -> str:
+    if text_lower is None:
+        text_lower = _ascii_lower(text)
+    return _first_label_in_text(text_lower, _SCHEDULE_TYPE_RULES)
+
+def determine_job_type(text: str, text_lower: Optional[str] = None) -> str:
     """
     Determine the job type (e.g., Permanent, Contract) from text.
+    Pass text_lower if the caller already has the lowercased text.
     Note: Simple keyword matching can be inaccurate.
     """
-    text_lower = text.lower()
-    # Order matters
-    if 'contract' in text_lower or 'fixed-term' in text_lower:
-        return 'Contract'
-    if 'freelance' in text_lower:
-        return 'Freelance'
-    if 'internship' in text_lower:
-        return 'Internship'
-    if 'permanent' in text_lower or 'full-time' in text_lower: # Often implies permanent
-        return 'Permanent'
-    if 'freelance' in text_lower:
-        return 'Freelance'
-    if 'internship' in text_lower:
-        return 'Internship'
-    return 'Unknown'
+    if text_lower is None:
+        text_lower = _ascii_lower(text)
+    return _first_label_in_text(text_lower, _JOB_TYPE_RULES)
 
 def extract_email(text: str) -> str:
     """Extract email address from text using regex."""
-    email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-    emails = re.findall(email_pattern, text)
-    return emails[0] if emails else ''
+    # Only the first address is used, so stop at the first match
+    match = _EMAIL_RE.search(text)
+    return match.group(0) if match else ''